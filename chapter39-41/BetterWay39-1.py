@@ -12,10 +12,9 @@
 해당 작업을 동시에 처리하려면 파이프라인에 가장 먼저 필요한 것은 작업을 전달할 방법이다.
 이 방법은 스레드 안전 생산자-소비자 큐(thread-safe producer-consumer queue)로 모델링 할 수 있다.
 """
-from threading import Lock
+from threading import Condition
 from collections import deque
 from threading import Thread
-import time
 
 
 def download(item):
@@ -30,20 +29,39 @@ def upload(item):
     return item
 
 
+class QueueClosed(Exception):
+    pass
+
+
 class MyQueue(object):
     def __init__(self):
         self.items = deque()
-        self.lock = Lock()
+        # Condition 은 Lock 을 감싸고, 기다리는 스레드를 재웠다가 깨우는 기능을 더한 것이다
+        self.lock = Condition()
+        self.closed = False
 
     # 생산자인 디지털 카메라는 새 이미지를 대기 아이템 리스트의 끝에 추가한다.
     def put(self, item):
         with self.lock:
             self.items.append(item)
+            self.lock.notify()  # 기다리는 소비자 하나를 깨운다
 
     # 소비자인 처리 파이프라인의 첫 번째 단계에서는 대기 아이템 리스트의 앞쪽에서 이미지를 꺼내온다.
-    def get(self):
+    # 큐가 비어 있으면 아이템이 들어오거나 큐가 닫힐 때까지 잠들어 기다린다.
+    # timeout 초 동안 아무것도 오지 않으면 예전처럼 IndexError 를 낸다(timeout=0 이면 기다리지 않는다).
+    def get(self, timeout=None):
+        with self.lock:
+            if not self.lock.wait_for(lambda: self.items or self.closed, timeout):
+                raise IndexError('get from an empty queue')
+            if self.items:
+                return self.items.popleft()
+            raise QueueClosed
+
+    # 더는 아이템을 넣지 않는다는 신호. 남은 아이템은 모두 꺼낼 수 있고, 그 다음 get 은 QueueClosed 를 낸다.
+    def close(self):
         with self.lock:
-            return self.items.popleft()
+            self.closed = True
+            self.lock.notify_all()
 
 
 """
@@ -65,10 +83,10 @@ class Worker(Thread):
         while True:
             self.polled_count += 1
             try:
-                item = self.in_queue.get()
+                item = self.in_queue.get()  # 일이 들어올 때까지 잠들어 있는다
             except IndexError:
-                time.sleep(0.01)  # No work to do
-            except AttributeError:
+                continue  # get(timeout=...) 으로 기다리다 시간이 다 된 경우
+            except (QueueClosed, AttributeError):
                 # The magic exit signal
                 return
             else:
@@ -80,6 +98,9 @@ class Worker(Thread):
 """
 가장 까다로운 부분은 이전 단계에서 아직 작업을 완료하지 않아서 입력 큐가 비어 있는 경우를 작업 스레드에서 적절하게
 처리하는 것이다. run 함수 코드가 이에 해당한다.
+처음에는 get 이 빈 큐에서 바로 IndexError 를 내고 작업 스레드가 10ms 씩 잠들었다가 다시 확인(폴링)했다.
+그러면 할 일이 없는 파이프라인도 수천 번씩 큐를 확인하고, 단계마다 최대 10ms 씩 늦어진다.
+지금의 MyQueue.get 은 threading.Condition 으로 아이템이 들어올 때까지 잠들어 있다가 put 이 깨워줄 때 돌아온다.
 
 이제 작업을 조율용 큐와 그에 해당하는 작업 스레드를 생성해서 세 단계를 연결하면 된다.
 """
@@ -104,16 +125,16 @@ for thread in threads:
 for _ in range(1000):
     download_queue.put(object())
 
-while len(done_queue.items) < 1000:
-    time.sleep(0.1)
-
-for thread in threads:
-    thread.in_queue = None
+# 앞 단계부터 차례로 큐를 닫고 그 단계의 스레드가 끝나기를 기다린다
+for queue, thread in zip((download_queue, resize_queue, upload_queue), threads):
+    queue.close()
+    thread.join()
 
 processed = len(done_queue.items)
 polled = sum(t.polled_count for t in threads)
 print('Processed', processed, 'items after polling',
       polled, 'times')
+print('Work done per stage:', [t.work_done for t in threads])
 
 """
 작업 수행 함수의 실행 속도가 제각각이면 초기 단계가 후속 단계의 진행을 막아 파이프라인이
@@ -2,8 +2,19 @@
 이런 모든 동작을 Queue의 서브클래스에 넣고, 처리를 중단해야 할 때 작업 스레드에 알리는 기능도 추가해보자.
 다음은 close 메서드를 정의하여 더는 입력 아이템이 없음을 알리는 특별한 아이템을 큐에 추가하는 코드이다.
 """
-from threading import Thread
-from queue import Queue
+from threading import Thread, Lock, Event, Semaphore
+from queue import Queue, Empty, Full, SimpleQueue
+from collections import deque, namedtuple
+from concurrent.futures import (ProcessPoolExecutor, Future, TimeoutError as FutureTimeout, wait,
+                                FIRST_COMPLETED)
+from multiprocessing.shared_memory import SharedMemory
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+import traceback
 
 
 def download(item):
@@ -18,12 +29,160 @@ def upload(item):
     return item
 
 
+class Histogram(object):
+    # 2의 거듭제곱 마이크로초 단위로 나눈 구간별 개수. 기록할 때는 정수 덧셈 몇 번이면 된다
+    def __init__(self):
+        self.buckets = [0] * 64
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.buckets[int(seconds * 1000000).bit_length()] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for i, count in enumerate(other.buckets):
+            self.buckets[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction):
+        # 구간의 위쪽 끝 값을 돌려주므로 실제 값보다 최대 두 배까지 크게 나온다
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(self.max, (1 << i) / 1000000)
+        return 0.0
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(0.5),
+            'p99': self.percentile(0.99),
+            'max': self.max,
+            # 구간의 위쪽 끝(마이크로초)별 개수. 비어 있는 구간은 뺀다
+            'buckets_us': {1 << i: count for i, count in enumerate(self.buckets) if count},
+        }
+
+
+class QueueMetrics(object):
+    def __init__(self):
+        self.put_count = 0
+        self.get_count = 0
+        self.high_water = 0  # 가장 많이 쌓였을 때의 아이템 수
+        self.put_times = deque()  # 큐에 있는 아이템들이 들어온 시각
+        self.wait = Histogram()  # 아이템이 큐에서 기다린 시간
+
+    def snapshot(self):
+        return {
+            'put_count': self.put_count,
+            'get_count': self.get_count,
+            'depth': len(self.put_times),
+            'high_water': self.high_water,
+            'wait': self.wait.snapshot(),
+        }
+
+
 class ClosableQueue(Queue):
     SENTINEL = object()
 
+    # metrics=True 면 넣고 뺀 개수, 최대 깊이, 아이템이 기다린 시간을 기록한다
+    # max_bytes 를 주면 sizeof 로 잰 아이템 크기의 합도 그 이하로 제한한다
+    def __init__(self, maxsize=0, metrics=False, max_bytes=0, sizeof=sys.getsizeof):
+        self.metrics = QueueMetrics() if metrics else None
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.sizes = deque()
+        self.cancelled = False
+        super().__init__(maxsize)
+
+    def _full(self):
+        if 0 < self.maxsize <= self._qsize():
+            return True
+        # 바이트 제한은 큐가 비어 있지 않을 때만 본다. 제한보다 큰 아이템도 하나는 들어갈 수 있다
+        return 0 < self.max_bytes <= self.bytes and self._qsize() > 0
+
+    def full(self):
+        with self.mutex:
+            return self._full()
+
+    # 취소된 큐에 넣는 아이템은 버린다
+    def put(self, item, block=True, timeout=None):
+        with self.not_full:
+            if self._full() and not self.not_full.wait_for(
+                    lambda: self.cancelled or not self._full(), timeout if block else 0):
+                raise Full
+            if self.cancelled:
+                return
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    # 실행 중에 크기 제한을 바꾼다. 늘어났다면 기다리던 생산자들을 깨운다
+    def set_bounds(self, maxsize=None, max_bytes=None):
+        with self.not_full:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            self.not_full.notify_all()
+
+    # Queue 는 락을 잡은 채로 _put, _get 을 부르므로 여기서 기록하면 따로 락이 필요 없다
+    def _put(self, item):
+        self.queue.append(item)
+        if self.max_bytes:
+            size = self.sizeof(item)
+            self.sizes.append(size)
+            self.bytes += size
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.put_times.append(time.perf_counter())
+            metrics.put_count += 1
+            depth = len(self.queue)
+            if depth > metrics.high_water:
+                metrics.high_water = depth
+
+    def _get(self):
+        item = self.queue.popleft()
+        if self.sizes:
+            self.bytes -= self.sizes.popleft()
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.get_count += 1
+            metrics.wait.record(time.perf_counter() - metrics.put_times.popleft())
+        return item
+
     def close(self):
         self.put(self.SENTINEL)
 
+    # 남은 아이템을 버리고 소비자 수만큼 SENTINEL 을 크기 제한과 상관없이 넣는다. 버린 개수를 돌려준다.
+    # 이미 꺼내서 처리 중인 아이템은 그대로 task_done 을 부를 수 있도록 unfinished_tasks 에서 버린 것만 뺀다.
+    def cancel(self, consumers=1):
+        with self.mutex:
+            self.cancelled = True
+            discarded = self._qsize()
+            self.queue.clear()
+            self.sizes.clear()
+            self.bytes = 0
+            if self.metrics is not None:
+                self.metrics.put_times.clear()
+            self.unfinished_tasks -= discarded
+            for _ in range(consumers):
+                self._put(self.SENTINEL)
+                self.unfinished_tasks += 1
+            self.not_empty.notify_all()
+            self.not_full.notify_all()
+            return discarded
+
     def __iter__(self):
         while True:
             item = self.get()
@@ -34,39 +193,1348 @@ class ClosableQueue(Queue):
             finally:
                 self.task_done()
 
+    # 여러 아이템을 락 한 번으로 넣는다. 큐 크기가 정해져 있으면 자리가 날 때마다 이어서 넣는다.
+    def put_many(self, items, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.not_full:
+            pending = 0  # 넣었지만 아직 소비자에게 알리지 않은 아이템 수
+            try:
+                for item in items:
+                    while self._full() and not self.cancelled:
+                        self.not_empty.notify(pending)  # 꽉 찼으면 소비자부터 깨운다
+                        pending = 0
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            raise Full
+                        self.not_full.wait(remaining)
+                    if self.cancelled:
+                        return
+                    self._put(item)
+                    self.unfinished_tasks += 1
+                    pending += 1
+            finally:
+                self.not_empty.notify(pending)
+
+    # 최대 max_items 개를 락 한 번으로 꺼낸다. 큐가 비어 있으면 하나라도 들어올 때까지 기다린다.
+    # SENTINEL 을 꺼내면 거기서 멈추므로 SENTINEL 은 항상 마지막에 온다.
+    def get_many(self, max_items, timeout=None):
+        with self.not_empty:
+            if not self.not_empty.wait_for(self._qsize, timeout):
+                raise Empty
+            items = []
+            while self._qsize() and len(items) < max_items:
+                item = self._get()
+                items.append(item)
+                if item is self.SENTINEL:
+                    break
+            self.not_full.notify(len(items))
+            return items
+
+    def task_done_many(self, count):
+        with self.all_tasks_done:
+            unfinished = self.unfinished_tasks - count
+            if unfinished <= 0:
+                if unfinished < 0:
+                    raise ValueError('task_done() called too many times')
+                self.all_tasks_done.notify_all()
+            self.unfinished_tasks = unfinished
+
+    def iter_batches(self, max_items):
+        while True:
+            batch = self.get_many(max_items)
+            try:
+                if batch[-1] is self.SENTINEL:
+                    if len(batch) > 1:
+                        yield batch[:-1]
+                    return
+                yield batch
+            finally:
+                self.task_done_many(len(batch))
+
+
+class WorkerMetrics(object):
+    def __init__(self, workers=1):
+        self.workers = workers  # 여러 작업 스레드의 기록을 merge 로 합쳤다면 그 수
+        self.items = 0
+        self.busy = 0.0  # func 를 실행한 시간의 합
+        self.started = time.perf_counter()
+        self.service = Histogram()  # func 를 한 번 실행하는 데 걸린 시간
+
+    def record(self, seconds, count):
+        self.items += count
+        self.busy += seconds
+        self.service.record(seconds)
+
+    def merge(self, other):
+        self.workers += other.workers
+        self.items += other.items
+        self.busy += other.busy
+        self.started = min(self.started, other.started)
+        self.service.merge(other.service)
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            'workers': self.workers,
+            'items': self.items,
+            'busy_ratio': self.busy / (elapsed * self.workers) if elapsed and self.workers else 0.0,
+            'throughput': self.items / elapsed if elapsed else 0.0,
+            'service': self.service.snapshot(),
+        }
+
+
+# 처리하다 실패한 아이템과 예외. dead_letters 큐로 간다
+Failure = namedtuple('Failure', ('item', 'error'))
+
+FAILED = object()  # call 이 실패했을 때 결과 대신 돌려주는 값
+
+
+class TimeoutCaller(object):
+    # func 를 도우미 스레드에서 부르고 timeout 초만 기다린다.
+    # 스레드는 밖에서 멈출 수 없으므로 시간이 지난 호출은 내버려 두고 다음 호출부터는 새 도우미 스레드를 쓴다.
+    def __init__(self):
+        self.requests = None
+
+    def helper(self, requests):
+        while True:
+            request = requests.get()
+            if request is None:
+                return
+            future, func, arg = request
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(func(arg))
+                except BaseException as error:
+                    future.set_exception(error)
+
+    def __call__(self, func, arg, timeout):
+        if self.requests is None:
+            self.requests = SimpleQueue()
+            Thread(target=self.helper, args=(self.requests,), daemon=True).start()
+        future = Future()
+        self.requests.put((future, func, arg))
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            self.close()  # 멈춰 있던 호출이 언젠가 끝나면 그 도우미 스레드도 끝난다
+            raise TimeoutError('%s took longer than %s seconds' % (func.__name__, timeout))
+
+    def close(self):
+        if self.requests is not None:
+            self.requests.put(None)
+            self.requests = None
+
 
 class StoppableWorker(Thread):
-    def __init__(self, func, in_queue, out_queue):
+    # batch_size 를 주면 func 는 아이템 리스트를 받아서 결과 리스트를 돌려줘야 한다
+    # func 가 예외를 던지거나 timeout 초를 넘기면 Failure 를 dead_letters 큐에 넣고 다음 아이템으로 넘어간다
+    def __init__(self, func, in_queue, out_queue, batch_size=None, metrics=False,
+                 dead_letters=None, timeout=None):
         super().__init__()
         self.func = func
         self.in_queue = in_queue
         self.out_queue = out_queue
+        self.batch_size = batch_size
+        self.metrics = WorkerMetrics() if metrics else None
+        self.dead_letters = dead_letters
+        self.timeout = timeout
+        self.caller = TimeoutCaller() if timeout is not None else None
 
     # 스레드가 실제 실행하는 메서드
     def run(self):
-        for item in self.in_queue:
-            result = self.func(item)
+        try:
+            if self.batch_size:
+                for batch in self.in_queue.iter_batches(self.batch_size):
+                    results = self.call(batch, len(batch))
+                    if results is not FAILED:
+                        self.out_queue.put_many(results)
+                return
+            for item in self.in_queue:
+                result = self.call(item)
+                if result is not FAILED:
+                    self.out_queue.put(result)
+        finally:
+            if self.caller is not None:
+                self.caller.close()
+
+    def call(self, arg, count=1):
+        start = time.perf_counter() if self.metrics is not None else 0
+        try:
+            if self.caller is None:
+                return self.func(arg)
+            return self.caller(self.func, arg, self.timeout)
+        except Exception as error:
+            self.fail(arg, error)
+            return FAILED
+        finally:
+            if self.metrics is not None:
+                self.metrics.record(time.perf_counter() - start, count)
+
+    def fail(self, arg, error):
+        if self.dead_letters is None:
+            traceback.print_exception(type(error), error, error.__traceback__)
+        else:
+            self.dead_letters.put(Failure(arg, error))
+
+
+def in_batches(func):
+    # 아이템 하나를 받는 함수를 아이템 리스트를 받는 함수로 바꾼다
+    def batch_func(items):
+        return [func(item) for item in items]
+    return batch_func
+
+
+if __name__ == '__main__':
+    download_queue = ClosableQueue()
+    resize_queue = ClosableQueue()
+    upload_queue = ClosableQueue()
+    done_queue = ClosableQueue()
+    threads = [
+        StoppableWorker(download, download_queue, resize_queue),
+        StoppableWorker(resize, resize_queue, upload_queue),
+        StoppableWorker(upload, upload_queue, done_queue),
+    ]
+
+    for thread in threads:
+        thread.start()
+    for _ in range(1000):
+        download_queue.put(object())
+    download_queue.close()  # 현재 프로세스가 이 큐에 더는 데이터를 넣지 않을 것을 나타냅니다
+    download_queue.join()
+    resize_queue.close()
+    resize_queue.join()
+    upload_queue.close()
+    upload_queue.join()
+    print(done_queue.qsize(), 'items finished')
+
+"""
+한 번에 여러 개씩 옮기기
+
+get, put, task_done 은 부를 때마다 Queue 의 뮤텍스를 잡는다. 아주 작은 아이템 수백만 개를 흘려보내면
+실제 작업보다 스레드끼리 락을 주고받는 데 시간을 더 쓴다.
+put_many 와 get_many 는 여러 아이템을 락 한 번으로 옮기고 task_done_many 는 꺼낸 개수만큼 한꺼번에 완료 처리한다.
+그래서 join 은 지금처럼 모든 아이템이 처리된 뒤에 돌아온다.
+StoppableWorker 에 batch_size 를 주면 func 를 아이템 리스트로 호출하고 결과를 put_many 로 넘긴다.
+"""
+
+
+def run_pipeline(count, batch_size=None):
+    wrap = in_batches if batch_size else (lambda func: func)
+    queues = [ClosableQueue() for _ in range(4)]
+    threads = [StoppableWorker(wrap(func), in_queue, out_queue, batch_size)
+               for func, in_queue, out_queue in zip((download, resize, upload), queues, queues[1:])]
+    for thread in threads:
+        thread.start()
+    start = time.time()
+    if batch_size:
+        queues[0].put_many(range(count))
+    else:
+        for item in range(count):
+            queues[0].put(item)
+    for queue in queues[:-1]:
+        queue.close()
+        queue.join()
+    end = time.time()
+    return queues[-1].qsize(), end - start
+
+
+if __name__ == '__main__':
+    for batch_size in (None, 100):
+        finished, seconds = run_pipeline(100000, batch_size)
+        print(finished, 'items finished in %.3f seconds with batch size' % seconds, batch_size)
+
+
+"""
+한 단계에 작업 스레드 여러 개
+
+단계마다 StoppableWorker 가 하나뿐이면 download, resize, upload 중 가장 느린 단계가 파이프라인 전체의 속도가 된다.
+Stage 는 같은 입력 큐를 나눠 먹는 작업 스레드 N개를 한 단계로 묶는다. 이렇게 하면 I/O 를 기다리는 단계만 따로 늘릴 수 있다.
+작업 스레드마다 SENTINEL 을 하나씩 받아야 빠져나오므로 close 는 입력 큐를 N번 닫는다.
+
+작업 스레드가 여러 개면 먼저 들어온 아이템이 먼저 끝난다는 보장이 없다. ordered=True 로 만들면
+입력 큐에서 꺼낸 순서대로 번호를 붙이고, 결과를 ReorderBuffer 에 모아뒀다가 번호 순서대로 출력 큐에 넣는다.
+"""
+
+
+class ReorderBuffer(object):
+    def __init__(self, out_queue):
+        self.out_queue = out_queue
+        self.lock = Lock()
+        self.pending = {}
+        self.next_sequence = 0  # 다음에 나눠줄 번호
+        self.next_output = 0  # 다음에 출력 큐로 내보낼 번호
+
+    def reserve(self):
+        # Stage 의 get_lock 을 잡은 채로 불러야 한다
+        sequence = self.next_sequence
+        self.next_sequence += 1
+        return sequence
+
+    def put(self, sequence, result):
+        with self.lock:
+            self.pending[sequence] = result
+            while self.next_output in self.pending:
+                result = self.pending.pop(self.next_output)
+                if result is not FAILED:  # 실패한 아이템은 번호만 건너뛴다
+                    self.out_queue.put(result)
+                self.next_output += 1
+
+
+class OrderedWorker(StoppableWorker):
+    def __init__(self, func, in_queue, reorder, get_lock, metrics=False, dead_letters=None,
+                 timeout=None):
+        super().__init__(func, in_queue, reorder.out_queue, metrics=metrics,
+                         dead_letters=dead_letters, timeout=timeout)
+        self.reorder = reorder
+        self.get_lock = get_lock
+
+    def run(self):
+        try:
+            while True:
+                # 아이템을 꺼내는 것과 번호를 받는 것이 한 번에 일어나야 순서가 맞는다
+                with self.get_lock:
+                    item = self.in_queue.get()
+                    if item is not self.in_queue.SENTINEL:
+                        sequence = self.reorder.reserve()
+                try:
+                    if item is self.in_queue.SENTINEL:
+                        return
+                    self.reorder.put(sequence, self.call(item))
+                finally:
+                    self.in_queue.task_done()
+        finally:
+            if self.caller is not None:
+                self.caller.close()
+
+
+class Stage(object):
+    def __init__(self, func, in_queue, out_queue, workers=1, ordered=False, batch_size=None,
+                 metrics=False, dead_letters=None, timeout=None):
+        if ordered and batch_size:
+            raise ValueError('Ordered stages take one item at a time')
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        if ordered:
+            reorder = ReorderBuffer(out_queue)
+            get_lock = Lock()
+            self.threads = [OrderedWorker(func, in_queue, reorder, get_lock, metrics,
+                                          dead_letters, timeout)
+                            for _ in range(workers)]
+        else:
+            self.threads = [StoppableWorker(func, in_queue, out_queue, batch_size, metrics,
+                                            dead_letters, timeout)
+                            for _ in range(workers)]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def close(self):
+        for _ in self.threads:
+            self.in_queue.close()
+
+    # 입력 큐에 남은 아이템을 버리고 작업 스레드를 끝낸다
+    def cancel(self):
+        return self.in_queue.cancel(len(self.threads))
+
+    def join(self):
+        # 취소했다면 남은 SENTINEL 을 꺼낼 스레드가 없을 수도 있으므로 스레드만 기다린다
+        if not getattr(self.in_queue, 'cancelled', False):
+            self.in_queue.join()
+        for thread in self.threads:
+            thread.join()
+
+
+"""
+다운로드와 업로드가 네트워크를 기다리느라 느린 경우, 그 두 단계만 작업 스레드를 늘리고 순서는 그대로 유지한다.
+"""
+
+
+def slow_download(item):
+    time.sleep(0.001 * (item % 3))  # 아이템마다 걸리는 시간이 다르다
+    return item
+
+
+def slow_upload(item):
+    time.sleep(0.001 * (item % 2))
+    return item
+
+
+def run_stages(count, workers):
+    queues = [ClosableQueue() for _ in range(4)]
+    stages = [
+        Stage(slow_download, queues[0], queues[1], workers=workers, ordered=True),
+        Stage(resize, queues[1], queues[2]),
+        Stage(slow_upload, queues[2], queues[3], workers=workers, ordered=True),
+    ]
+    for stage in stages:
+        stage.start()
+    start = time.time()
+    for item in range(count):
+        queues[0].put(item)
+    for stage in stages:
+        stage.close()
+        stage.join()
+    end = time.time()
+    return list(queues[3].queue), end - start
+
+
+if __name__ == '__main__':
+    for workers in (1, 8):
+        results, seconds = run_stages(300, workers)
+        print('%d workers per slow stage: %.3f seconds, in order: %s' % (
+        workers, seconds, results == list(range(300))))
+
+
+"""
+CPU 를 쓰는 단계는 프로세스에서
+
+스레드는 GIL 때문에 한 번에 하나만 파이썬 코드를 실행한다. 그래서 실제로 이미지를 줄이는 resize 처럼
+CPU 를 많이 쓰는 단계는 StoppableWorker 를 늘려도 빨라지지 않는다.
+ProcessStage 는 BetterWay41 에서 gcd 를 계산할 때처럼 func 를 ProcessPoolExecutor 에서 실행하면서도
+앞뒤로는 똑같이 ClosableQueue 와 연결된다. 그래서 스레드 단계와 프로세스 단계를 한 파이프라인에 섞어 쓸 수 있다.
+
+- 아이템 하나마다 프로세스 사이에 주고받으면 피클링과 IPC 비용이 더 크므로 chunk_size 개씩 묶어서 보낸다.
+- 실행 중인 묶음(future)은 max_in_flight 개까지만 둔다. 그 이상이면 입력 큐에서 더 꺼내지 않으므로
+  앞 단계가 아무리 빨라도 프로세스 쪽에 일이 무한정 쌓이지 않는다.
+- 보내는 스레드(feed)와 결과를 받는 스레드(collect)를 나눠서 결과는 들어온 순서대로 출력 큐에 넣는다.
+func 는 피클링할 수 있도록 모듈 최상위에 정의된 함수여야 한다.
+"""
+
+
+def apply_chunk(func, items):
+    return [func(item) for item in items]
+
+
+class ProcessStage(Stage):
+    # timeout 은 청크 하나가 실행을 시작한 뒤 결과가 나올 때까지 기다릴 최대 시간이다
+    def __init__(self, func, in_queue, out_queue, workers=None, chunk_size=16,
+                 max_in_flight=None, executor=None, dead_letters=None, timeout=None):
+        self.func = func
+        self.dead_letters = dead_letters
+        self.timeout = timeout
+        self.cancelled = Future()  # cancel 하면 완료되어서 collect 가 결과를 기다리던 것을 멈춘다
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.chunk_size = chunk_size
+        self.owns_executor = executor is None
+        self.executor = executor or ProcessPoolExecutor(max_workers=workers)
+        self.in_flight = Queue(max_in_flight or 2 * (workers or os.cpu_count() or 1))
+        # timeout 이 있으면 작업 프로세스 수만큼만 실행 중으로 둔다. 그래야 제출한 청크가 executor 안에서
+        # 다른 청크를 기다리지 않고 바로 실행되므로 제출한 시각부터 잰 시간이 실행 시간이 된다.
+        # 자리는 청크가 실제로 끝났을 때 돌려받으므로 시간이 지나서 버린 청크도 끝날 때까지 자리를 차지한다.
+        self.slots = Semaphore(workers or os.cpu_count() or 1) if timeout is not None else None
+        self.threads = [Thread(target=self.feed), Thread(target=self.collect)]
+
+    def feed(self):
+        while True:
+            chunk = self.in_queue.get_many(self.chunk_size)
+            closing = chunk[-1] is self.in_queue.SENTINEL
+            items = chunk[:-1] if closing else chunk
+            if items:
+                if self.slots is not None:
+                    self.slots.acquire()
+                try:
+                    future = self.executor.submit(apply_chunk, self.func, items)
+                except Exception as error:  # cancel 이 작업 프로세스를 끝냈다면 BrokenProcessPool
+                    if self.slots is not None:
+                        self.slots.release()
+                    self.fail(items, error)
+                    self.in_queue.task_done_many(len(items))
+                else:
+                    if self.slots is not None:
+                        future.add_done_callback(lambda _: self.slots.release())
+                    # in_flight 가 꽉 차 있으면 여기서 기다린다
+                    self.in_flight.put((future, items, time.monotonic()))
+            if closing:
+                self.in_flight.put(None)
+                self.in_queue.task_done()
+                return
+
+    def collect(self):
+        while True:
+            entry = self.in_flight.get()
+            if entry is None:
+                return
+            future, items, submitted = entry
+            try:
+                remaining = None
+                if self.timeout is not None:
+                    remaining = max(0, submitted + self.timeout - time.monotonic())
+                done, _ = wait((future, self.cancelled), remaining, FIRST_COMPLETED)
+                if future in done:
+                    self.out_queue.put_many(future.result())
+                elif not self.cancelled.done():
+                    future.cancel()
+                    raise TimeoutError('chunk of %d items took longer than %s seconds' % (
+                        len(items), self.timeout))
+                else:
+                    future.cancel()  # 취소했으니 결과는 버린다
+            except Exception as error:
+                # 청크 안의 아이템 하나가 실패해도 청크 전체가 실패한다
+                self.fail(items, error)
+            finally:
+                self.in_queue.task_done_many(len(items))
+
+    def fail(self, items, error):
+        if self.dead_letters is None:
+            traceback.print_exception(type(error), error, error.__traceback__)
+        else:
+            self.dead_letters.put(Failure(items, error))
+
+    def close(self):
+        self.in_queue.close()  # SENTINEL 은 feed 스레드 하나만 받는다
+
+    # 실행 중인 작업은 future 로 취소할 수 없으므로 직접 만든 풀이라면 작업 프로세스를 끝낸다
+    def cancel(self):
+        if not self.cancelled.done():
+            self.cancelled.set_result(None)
+        discarded = self.in_queue.cancel()
+        if self.owns_executor:
+            terminate_workers = getattr(self.executor, 'terminate_workers', None)  # 파이썬 3.14
+            if terminate_workers is not None:
+                terminate_workers()
+            else:
+                for process in list((self.executor._processes or {}).values()):
+                    process.terminate()
+        return discarded
+
+    def join(self):
+        super().join()
+        if self.owns_executor:
+            self.executor.shutdown()
+
+
+"""
+다운로드와 업로드는 스레드 단계로, resize 는 프로세스 단계로 만든다.
+"""
+
+
+def cpu_resize(item):
+    # 이미지를 줄이는 대신 CPU 를 쓰는 계산을 한다
+    total = 0
+    for i in range(20000):
+        total += i * i % (item + 1)
+    return item
+
+
+def run_mixed(count, resize_stage):
+    queues = [ClosableQueue() for _ in range(4)]
+    stages = [
+        Stage(slow_download, queues[0], queues[1], workers=8, ordered=True),
+        resize_stage(queues[1], queues[2]),
+        Stage(slow_upload, queues[2], queues[3], workers=8, ordered=True),
+    ]
+    for stage in stages:
+        stage.start()
+    start = time.time()
+    for item in range(count):
+        queues[0].put(item)
+    for stage in stages:
+        stage.close()
+        stage.join()
+    end = time.time()
+    return list(queues[3].queue), end - start
+
+
+if __name__ == '__main__':
+    for name, resize_stage in (
+            ('threads', lambda in_queue, out_queue: Stage(cpu_resize, in_queue, out_queue,
+                                                          workers=4, ordered=True)),
+            ('processes', lambda in_queue, out_queue: ProcessStage(cpu_resize, in_queue, out_queue,
+                                                                   workers=4, chunk_size=8))):
+        results, seconds = run_mixed(200, resize_stage)
+        print('resize with %s: %.3f seconds, %d items, in order: %s' % (
+            name, seconds, len(results), results == list(range(200))))
+
+
+"""
+asyncio 로 만든 파이프라인
+
+다운로드와 업로드 수천 개를 동시에 기다리려고 연결마다 스레드를 하나씩 쓰면 메모리가 너무 많이 든다(스레드당 약 8MB).
+asyncio 의 코루틴은 기다리는 동안 스레드를 잡고 있지 않으므로 하나의 스레드에서 수만 개를 동시에 기다릴 수 있다.
+AsyncClosableQueue 는 asyncio.Queue 에 ClosableQueue 와 똑같은 SENTINEL 과 반복(async for) 동작을 붙인 것이다.
+AsyncStage 는 같은 입력 큐를 나눠 먹는 코루틴 concurrency 개로 한 단계를 만든다.
+
+스레드 단계와 섞어 쓰려면 두 종류의 큐 사이에서 아이템을 옮겨주는 다리가 필요하다.
+AsyncToSync 는 이벤트 루프 안에서 ClosableQueue 로 넘기고(큐 크기가 정해져 있으면 별도 스레드에서 기다린다),
+SyncToAsync 는 스레드에서 ClosableQueue 를 읽어 이벤트 루프의 AsyncClosableQueue 로 넘긴다.
+"""
+
+
+class AsyncClosableQueue(asyncio.Queue):
+    SENTINEL = object()
+
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self.cancelled = False
+
+    # 취소된 큐에 넣는 아이템은 버린다
+    def put_nowait(self, item):
+        if not self.cancelled:
+            super().put_nowait(item)
+
+    async def close(self):
+        await self.put(self.SENTINEL)
+
+    # ClosableQueue.cancel 과 같다. 이벤트 루프 안에서 불러야 한다
+    def cancel(self, consumers=1):
+        self.cancelled = True
+        discarded = 0
+        while not self.empty():
+            self.get_nowait()
+            self.task_done()
+            discarded += 1
+        for _ in range(consumers):
+            # put_nowait 와 같지만 maxsize 를 넘어도 넣는다
+            self._put(self.SENTINEL)
+            self._unfinished_tasks += 1
+            self._finished.clear()
+            self._wakeup_next(self._getters)
+        return discarded
+
+    async def __aiter__(self):
+        while True:
+            item = await self.get()
+            try:
+                if item is self.SENTINEL:
+                    return
+                yield item
+            finally:
+                self.task_done()
+
+
+class AsyncStage(object):
+    # dead_letters 는 ClosableQueue 나 AsyncClosableQueue 둘 다 된다
+    def __init__(self, func, in_queue, out_queue, concurrency=1, dead_letters=None, timeout=None):
+        self.func = func  # 코루틴 함수
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.concurrency = concurrency
+        self.dead_letters = dead_letters
+        self.timeout = timeout
+        self.tasks = []
+
+    async def run(self):
+        async for item in self.in_queue:
+            try:
+                result = await asyncio.wait_for(self.func(item), self.timeout)
+            except Exception as error:
+                await self.fail(item, error)
+                continue
+            await self.emit(result)
+
+    async def fail(self, item, error):
+        if self.dead_letters is None:
+            traceback.print_exception(type(error), error, error.__traceback__)
+        elif isinstance(self.dead_letters, asyncio.Queue):
+            await self.dead_letters.put(Failure(item, error))
+        else:
+            self.dead_letters.put(Failure(item, error))
+
+    async def emit(self, result):
+        await self.out_queue.put(result)
+
+    def start(self):
+        # 실행 중인 이벤트 루프 안에서 불러야 한다
+        self.tasks = [asyncio.create_task(self.run()) for _ in range(self.concurrency)]
+
+    async def close(self):
+        for _ in self.tasks:
+            await self.in_queue.close()
+
+    def cancel(self):
+        return self.in_queue.cancel(self.concurrency)
+
+    async def join(self):
+        await self.in_queue.join()
+        await asyncio.gather(*self.tasks)
+
+
+async def passthrough(item):
+    return item
+
+
+class AsyncToSync(AsyncStage):
+    def __init__(self, in_queue, out_queue):
+        super().__init__(passthrough, in_queue, out_queue)
+
+    async def emit(self, result):
+        # 개수나 바이트 크기 중 하나라도 제한이 있으면 put 이 기다릴 수 있다
+        if self.out_queue.maxsize > 0 or getattr(self.out_queue, 'max_bytes', 0) > 0:
+            await asyncio.to_thread(self.out_queue.put, result)  # 이벤트 루프를 막지 않는다
+        else:
             self.out_queue.put(result)
 
 
-download_queue = ClosableQueue()
-resize_queue = ClosableQueue()
-upload_queue = ClosableQueue()
-done_queue = ClosableQueue()
-threads = [
-    StoppableWorker(download, download_queue, resize_queue),
-    StoppableWorker(resize, resize_queue, upload_queue),
-    StoppableWorker(upload, upload_queue, done_queue),
-]
-
-for thread in threads:
-    thread.start()
-for _ in range(1000):
-    download_queue.put(object())
-download_queue.close()  # 현재 프로세스가 이 큐에 더는 데이터를 넣지 않을 것을 나타냅니다
-download_queue.join()
-resize_queue.close()
-resize_queue.join()
-upload_queue.close()
-upload_queue.join()
-print(done_queue.qsize(), 'items finished')
+class SyncToAsync(Stage):
+    def __init__(self, in_queue, out_queue, loop):
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.loop = loop
+        self.threads = [Thread(target=self.run)]
+
+    def run(self):
+        for item in self.in_queue:
+            asyncio.run_coroutine_threadsafe(self.out_queue.put(item), self.loop).result()
+
+
+"""
+다운로드와 업로드는 코루틴 1000개씩, resize 는 지금까지 쓰던 스레드 단계로 만든다.
+"""
+
+
+async def async_download(item):
+    await asyncio.sleep(0.01)  # 네트워크를 기다린다
+    return item
+
+
+async def async_upload(item):
+    await asyncio.sleep(0.01)
+    return item
+
+
+async def run_async_pipeline(count, concurrency):
+    loop = asyncio.get_running_loop()
+    download_queue = AsyncClosableQueue()
+    downloaded_queue = AsyncClosableQueue()
+    resize_queue = ClosableQueue()
+    resized_queue = ClosableQueue()
+    upload_queue = AsyncClosableQueue()
+    done_queue = AsyncClosableQueue()
+    download_stage = AsyncStage(async_download, download_queue, downloaded_queue, concurrency)
+    to_sync = AsyncToSync(downloaded_queue, resize_queue)
+    resize_stage = Stage(resize, resize_queue, resized_queue)
+    to_async = SyncToAsync(resized_queue, upload_queue, loop)
+    upload_stage = AsyncStage(async_upload, upload_queue, done_queue, concurrency)
+    for stage in (download_stage, to_sync, resize_stage, to_async, upload_stage):
+        stage.start()
+    start = time.time()
+    for item in range(count):
+        await download_queue.put(item)
+    for stage in (download_stage, to_sync, resize_stage, to_async, upload_stage):
+        if isinstance(stage, AsyncStage):
+            await stage.close()
+            await stage.join()
+        else:
+            # 큐 크기가 정해져 있으면 close 도 블록될 수 있으므로 이벤트 루프 밖에서 부른다
+            await asyncio.to_thread(stage.close)
+            await asyncio.to_thread(stage.join)
+    end = time.time()
+    return done_queue.qsize(), end - start
+
+
+if __name__ == '__main__':
+    finished, seconds = asyncio.run(run_async_pipeline(10000, 1000))
+    print('%d items finished in %.3f seconds with 1000 coroutines per I/O stage' % (finished, seconds))
+
+
+"""
+어느 단계가 막혔는지 보기
+
+파이프라인이 멈췄을 때 download_queue, resize_queue, upload_queue 중 어디에 아이템이 쌓이는지, 아이템이
+큐에서 얼마나 기다리는지 알 수가 없었다. ClosableQueue(metrics=True) 는 넣고 뺀 개수와 가장 많이 쌓였을 때의
+깊이, 아이템이 큐에서 기다린 시간을 기록하고, StoppableWorker(metrics=True) 는 처리한 개수와 func 실행 시간,
+일한 시간의 비율(busy_ratio, 나머지는 입력을 기다린 시간)을 기록한다.
+기록은 이미 잡고 있는 락 안에서 정수 덧셈 몇 번으로 끝나므로 운영 환경에서 켜둬도 부담이 적다.
+시간은 2의 거듭제곱 구간으로 나눈 히스토그램에 모으므로 메모리도 일정하다.
+
+pipeline_snapshot 은 이름을 붙인 큐와 단계들의 기록을 dict 하나로 모으고,
+(단계는 작업 스레드들의 WorkerMetrics 를 merge 로 합친다. 히스토그램은 백분위수와 함께 구간별 개수도 내보낸다.
+metrics=True 없이 만든 큐는 깊이만 내보낸다)
+MetricsReporter 는 일정한 간격으로 그 dict 를 한 줄짜리 JSON(JSON lines)으로 기록한다.
+"""
+
+
+def pipeline_snapshot(components):
+    snapshot = {'time': time.time()}
+    for name, component in components.items():
+        if isinstance(component, ClosableQueue):
+            if component.metrics is None:
+                # metrics=True 없이 만든 큐는 지금 깊이만 알 수 있다
+                snapshot[name] = {'metrics': False, 'depth': component.qsize()}
+            else:
+                snapshot[name] = component.metrics.snapshot()
+            continue
+        # Stage 는 작업 스레드들의 기록을 합친다
+        total = WorkerMetrics(workers=0)
+        for thread in getattr(component, 'threads', [component]):
+            if getattr(thread, 'metrics', None) is not None:
+                total.merge(thread.metrics)
+        snapshot[name] = total.snapshot()
+    return snapshot
+
+
+class MetricsReporter(Thread):
+    def __init__(self, components, out=None, interval=1.0):
+        super().__init__(daemon=True)
+        self.components = components
+        self.out = out if out is not None else sys.stdout
+        self.interval = interval
+        self.stopped = Event()
+
+    def run(self):
+        # sleep 대신 wait 를 쓰면 stop 을 부르자마자 깨어나고, 멈춘 뒤에는 기록하지 않는다
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        self.out.write(json.dumps(pipeline_snapshot(self.components)) + '\n')
+        self.out.flush()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()  # 스레드가 쓰던 줄과 섞이지 않도록 끝날 때까지 기다린 뒤에
+        self.report()  # 마지막 상태를 한 번만 남긴다
+
+
+"""
+resize 가 가장 느린 파이프라인에서는 resize_queue 에 아이템이 쌓이고 resize 단계의 busy_ratio 가 1에 가깝다.
+"""
+
+
+def slow_resize(item):
+    time.sleep(0.002)
+    return item
+
+
+if __name__ == '__main__':
+    queues = [ClosableQueue(metrics=True) for _ in range(4)]
+    stages = {
+        'download': Stage(download, queues[0], queues[1], metrics=True),
+        'resize': Stage(slow_resize, queues[1], queues[2], metrics=True),
+        'upload': Stage(upload, queues[2], queues[3], metrics=True),
+    }
+    components = dict(zip(('download_queue', 'resize_queue', 'upload_queue', 'done_queue'), queues))
+    components.update(stages)
+    reporter = MetricsReporter(components, interval=0.1)
+    reporter.start()
+    for stage in stages.values():
+        stage.start()
+    for item in range(100):
+        queues[0].put(item)
+    for stage in stages.values():
+        stage.close()
+        stage.join()
+    reporter.stop()
+
+
+"""
+큐 크기를 저절로 맞추기
+
+BetterWay39-3 에서 본 것처럼 Queue(1) 처럼 크기를 정하면 큐가 찼을 때 생산자의 put 이 블록된다.
+그런데 지금까지의 파이프라인은 크기 제한이 없는 ClosableQueue() 를 써서, download 가 resize 보다 빠르면
+그 사이의 큐에 아이템이 끝없이 쌓이고 메모리도 그만큼 늘어난다.
+크기를 너무 작게 잡으면 빠른 단계가 자주 멈추고, 너무 크게 잡으면 메모리를 낭비한다.
+
+- ClosableQueue 는 아이템 개수뿐 아니라 바이트 수(max_bytes)로도 제한할 수 있다.
+- BackpressureController 는 각 큐를 소비하는 단계의 처리 속도(metrics=True 로 잰 값)를 주기적으로 보고
+  큐 크기를 "초당 처리량 x target_latency" 로 맞춘다(리틀의 법칙). 아이템이 큐에서 기다리는 시간이
+  대략 target_latency 를 넘지 않을 만큼만 쌓아두는 것이다.
+- 소스는 아이템을 넣기 전에 admit() 을 불러서, 뒤쪽 큐 중 하나라도 꽉 차 있으면 기다린다.
+그래서 과부하가 걸려도 메모리 사용량이 늘어나지 않고 일정하게 유지된다.
+"""
+
+
+class BackpressureController(Thread):
+    # edges 는 (큐, 그 큐를 소비하는 Stage) 쌍의 리스트이고 Stage 는 metrics=True 로 만들어야 한다
+    def __init__(self, edges, target_latency=0.1, min_size=1, max_size=10000,
+                 initial_size=16, interval=0.05):
+        super().__init__(daemon=True)
+        self.edges = edges
+        self.target_latency = target_latency
+        self.min_size = min_size
+        self.max_size = max_size
+        self.interval = interval
+        self.last = {}  # 큐마다 지난번에 본 (처리한 개수, 일한 시간)
+        self.stopped = False
+        for queue, _ in edges:
+            if queue.maxsize <= 0:
+                queue.set_bounds(maxsize=initial_size)
+
+    def run(self):
+        while not self.stopped:
+            time.sleep(self.interval)
+            self.adjust()
+
+    def adjust(self):
+        for queue, stage in self.edges:
+            workers = [thread.metrics for thread in stage.threads
+                       if getattr(thread, 'metrics', None) is not None]
+            items = sum(metrics.items for metrics in workers)
+            busy = sum(metrics.busy for metrics in workers)
+            last_items, last_busy = self.last.get(id(queue), (0, 0.0))
+            self.last[id(queue)] = (items, busy)
+            if items <= last_items or busy <= last_busy:
+                continue
+            # 작업 스레드 하나가 1초에 처리하는 개수 x 작업 스레드 수
+            rate = (items - last_items) / (busy - last_busy) * len(workers)
+            size = int(math.ceil(rate * self.target_latency))
+            queue.set_bounds(maxsize=max(self.min_size, min(self.max_size, size)))
+
+    def saturated(self):
+        return any(queue.full() for queue, _ in self.edges)
+
+    # 가득 찬 큐가 있으면 그 큐의 not_full 조건 변수에서 자리가 날 때까지 기다린다
+    def admit(self):
+        while True:
+            full = [queue for queue, _ in self.edges if queue.full()]
+            if not full:
+                return
+            queue = full[0]
+            with queue.not_full:
+                queue.not_full.wait_for(lambda: not queue._full())
+                # get 은 기다리는 스레드 하나만 깨운다. 자리를 쓰지 않았으니 put 에서 기다리는 스레드에게 넘겨준다
+                queue.not_full.notify()
+
+    def stop(self):
+        self.stopped = True
+
+
+"""
+download 는 아주 빠르고 resize 는 아이템 하나에 2ms 가 걸린다. 크기 제한이 없으면 resize_queue 에 거의
+모든 아이템이 쌓이지만, 컨트롤러를 쓰면 resize 가 0.02초 안에 처리할 수 있는 만큼만 쌓인다.
+"""
+
+
+def run_backpressure(count, controlled):
+    queues = [ClosableQueue(metrics=True, max_bytes=1 << 20) for _ in range(4)]
+    stages = [
+        Stage(download, queues[0], queues[1], metrics=True),
+        Stage(slow_resize, queues[1], queues[2], metrics=True),
+        Stage(upload, queues[2], queues[3], metrics=True),
+    ]
+    controller = None
+    if controlled:
+        controller = BackpressureController(list(zip(queues[:3], stages)), target_latency=0.02)
+        controller.start()
+    for stage in stages:
+        stage.start()
+    for item in range(count):
+        if controller is not None:
+            controller.admit()
+        queues[0].put(bytes(100))
+    for stage in stages:
+        stage.close()
+        stage.join()
+    if controller is not None:
+        controller.stop()
+    return queues[1].metrics.high_water
+
+
+if __name__ == '__main__':
+    for controlled in (False, True):
+        print('resize_queue high water mark with controller=%s:' % controlled,
+              run_backpressure(300, controlled))
+
+
+"""
+생산자 하나, 소비자 하나를 위한 링 버퍼
+
+StoppableWorker 단계 사이의 큐는 넣는 스레드도 하나, 꺼내는 스레드도 하나뿐이다(SPSC).
+그런데도 queue.Queue 는 아이템마다 뮤텍스를 잡고 조건 변수로 상대 스레드에게 신호를 보낸다.
+RingQueue 는 크기가 고정된 리스트를 원형으로 쓴다. tail 은 생산자만, head 와 done 은 소비자만 바꾸므로
+두 스레드가 같은 변수를 동시에 쓰는 일이 없어서 락이 필요 없다(정수 하나를 읽고 쓰는 것은 GIL 이 보장한다).
+상대가 잠들어 있을 때(consumer_waiting, producer_waiting)만 Event 로 깨우기 때문에, 소비자가 바쁘게
+일하는 동안에는 아이템마다 신호를 보내는 비용이 없다.
+잠들기 전에 먼저 잠든다고 표시하고 나서 한 번 더 확인하므로 신호를 놓치지 않는다.
+
+ClosableQueue 와 같은 put, get, close, __iter__, task_done, join 을 제공하므로 단계 사이의 큐로 그대로 쓸 수 있다.
+단, 생산자와 소비자가 각각 스레드 하나일 때만 안전하다. 여러 작업 스레드가 있는 Stage 에는 쓰면 안 된다.
+"""
+
+
+class RingQueue(object):
+    SENTINEL = ClosableQueue.SENTINEL
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.head = 0  # 다음에 꺼낼 위치(누적), 소비자만 바꾼다
+        self.tail = 0  # 다음에 넣을 위치(누적), 생산자만 바꾼다
+        self.done = 0  # task_done 을 부른 횟수, 소비자만 바꾼다
+        self.not_empty = Event()
+        self.not_full = Event()
+        self.all_done = Event()
+        self.consumer_waiting = False
+        self.producer_waiting = False
+        self.joiner_waiting = False
+
+    def qsize(self):
+        return self.tail - self.head
+
+    def put(self, item):
+        while self.tail - self.head >= self.capacity:
+            self.not_full.clear()
+            self.producer_waiting = True
+            if self.tail - self.head >= self.capacity:
+                self.not_full.wait()
+            self.producer_waiting = False
+        self.slots[self.tail % self.capacity] = item
+        self.tail += 1
+        if self.consumer_waiting:
+            self.not_empty.set()
+
+    def get(self):
+        while self.head == self.tail:
+            self.not_empty.clear()
+            self.consumer_waiting = True
+            if self.head == self.tail:
+                self.not_empty.wait()
+            self.consumer_waiting = False
+        index = self.head % self.capacity
+        item = self.slots[index]
+        self.slots[index] = None
+        self.head += 1
+        if self.producer_waiting:
+            self.not_full.set()
+        return item
+
+    def task_done(self):
+        self.done += 1
+        if self.joiner_waiting and self.done >= self.tail:
+            self.all_done.set()
+
+    def join(self):
+        while self.done < self.tail:
+            self.all_done.clear()
+            self.joiner_waiting = True
+            if self.done < self.tail:
+                self.all_done.wait()
+            self.joiner_waiting = False
+
+    def close(self):
+        self.put(self.SENTINEL)
+
+    def __iter__(self):
+        while True:
+            item = self.get()
+            try:
+                if item is self.SENTINEL:
+                    return
+                yield item
+            finally:
+                self.task_done()
+
+
+"""
+생산자 스레드 하나와 소비자 스레드 하나 사이로 아이템을 옮기는 시간을 두 큐로 재본다.
+"""
+
+
+def benchmark_queue(make_queue, count):
+    queue = make_queue()
+    consumer = Thread(target=lambda: sum(1 for _ in queue))
+    consumer.start()
+    start = time.perf_counter()
+    for item in range(count):
+        queue.put(item)
+    queue.close()
+    queue.join()
+    consumer.join()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    for name, make_queue in (('ClosableQueue', ClosableQueue), ('RingQueue', RingQueue)):
+        seconds = min(benchmark_queue(make_queue, 200000) for _ in range(3))
+        print('%-13s %.0f items/sec' % (name, 200000 / seconds))
+    queues = [RingQueue() for _ in range(4)]
+    threads = [StoppableWorker(func, in_queue, out_queue)
+               for func, in_queue, out_queue in zip((download, resize, upload), queues, queues[1:])]
+    for thread in threads:
+        thread.start()
+    for item in range(1000):
+        queues[0].put(item)
+    for queue in queues[:-1]:
+        queue.close()
+        queue.join()
+    print(queues[-1].qsize(), 'items finished through RingQueue edges')
+
+
+"""
+실패, 타임아웃, 취소
+
+download, resize, upload 중 하나가 예외를 던지면 예전에는 그 StoppableWorker 스레드가 조용히 죽었다.
+그 뒤로는 아무도 입력 큐에서 아이템을 꺼내지 않으므로 download_queue.join() 이 영원히 돌아오지 않는다.
+이제 작업 스레드는 예외가 나도 죽지 않는다. 실패한 아이템은 Failure(item, error) 로 dead_letters 큐에 넣고
+(dead_letters 가 없으면 트레이스백만 출력하고) 다음 아이템으로 넘어간다.
+순서를 지키는 단계에서는 실패한 아이템의 번호를 건너뛰므로 뒤의 결과가 막히지 않는다.
+
+timeout 을 주면 func 를 도우미 스레드에서 실행하고 그 시간만 기다린다. 시간이 지나면 TimeoutError 로 실패 처리한다.
+파이썬 스레드는 밖에서 강제로 멈출 수 없으므로 멈춘 호출은 데몬 스레드에 남겨두고 잊어버린다.
+ProcessStage 의 timeout 은 청크 단위이고 청크가 실행을 시작한 뒤부터 잰다. 그러려고 timeout 이 있으면
+작업 프로세스 수만큼만 청크를 실행 중으로 둔다(다른 곳과 같이 쓰는 executor 를 넘겼다면 다른 작업을 기다리는 시간도 들어간다).
+시간이 지난 청크는 실패 처리하지만 작업 프로세스는 그 청크를 계속 붙잡고 있다.
+정말로 멈춰야 하는 작업이라면 executor 를 넘기지 않은 ProcessStage 에서 실행한다. 그런 ProcessStage 를 cancel 하면
+작업 프로세스를 끝내므로 멈춘 작업도 함께 끝난다.
+
+cancel_pipeline 은 모든 단계의 입력 큐를 취소한다. 큐에 남은 아이템은 버리고, 작업 스레드 수만큼 SENTINEL 을
+크기 제한과 상관없이 넣는다. 취소된 큐에 넣는 아이템은 버려지므로 꽉 찬 큐 앞에서 기다리던 생산자도 풀려난다.
+처리 중이던 아이템 하나씩만 끝나면 스레드가 모두 끝나며, timeout 초가 지나도 살아 있는 스레드는 돌려준다.
+남은 아이템까지 모두 처리하고 끝내려면 지금처럼 close 와 join 을 부르면 된다.
+AsyncStage 의 태스크와 asyncio 큐는 이벤트 루프 안에서만 다룰 수 있으므로 AsyncStage 가 섞인 파이프라인은
+이벤트 루프 안에서 cancel_pipeline_async 로 취소한다. 스레드 단계의 스레드는 asyncio.to_thread 로 기다린다.
+AsyncStage 에도 dead_letters 와 timeout 이 있다. timeout 은 asyncio.wait_for 로 코루틴을 취소하므로 실제로 멈춘다.
+"""
+
+
+def cancel_pipeline(stages, timeout=None):
+    if any(isinstance(stage, AsyncStage) for stage in stages):
+        raise TypeError('Cancel pipelines with an AsyncStage with cancel_pipeline_async')
+    deadline = None if timeout is None else time.monotonic() + timeout
+    discarded = sum(stage.cancel() for stage in stages)
+    alive = []
+    for stage in stages:
+        for thread in stage.threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+            if thread.is_alive():
+                alive.append(thread)
+    return discarded, alive
+
+
+async def cancel_pipeline_async(stages, timeout=None):
+    discarded = sum(stage.cancel() for stage in stages)
+    tasks = [task for stage in stages for task in getattr(stage, 'tasks', ())]
+    threads = [thread for stage in stages for thread in getattr(stage, 'threads', ())]
+    deadline = None if timeout is None else time.monotonic() + timeout
+    if tasks:
+        await asyncio.wait(tasks, timeout=timeout)
+    alive = [task for task in tasks if not task.done()]
+    for thread in threads:
+        remaining = None if deadline is None else max(0, deadline - time.monotonic())
+        await asyncio.to_thread(thread.join, remaining)
+        if thread.is_alive():
+            alive.append(thread)
+    return discarded, alive
+
+
+"""
+아이템 7개 중 하나는 resize 가 예외를 던지고 하나는 upload 가 멈춘다. 나머지 다섯 개는 그대로 끝나고
+실패한 두 개는 dead_letters 에 모인다. 그 다음에는 느린 파이프라인을 중간에 취소해본다.
+"""
+
+
+def flaky_resize(item):
+    if item == 3:
+        raise ValueError('corrupt image %d' % item)
+    return item
+
+
+def hanging_upload(item):
+    if item == 5:
+        time.sleep(10)  # 응답이 없는 서버
+    return item
+
+
+if __name__ == '__main__':
+    queues = [ClosableQueue() for _ in range(4)]
+    dead_letters = ClosableQueue()
+    stages = [
+        Stage(download, queues[0], queues[1]),
+        Stage(flaky_resize, queues[1], queues[2], dead_letters=dead_letters),
+        Stage(hanging_upload, queues[2], queues[3], workers=2, ordered=True,
+              dead_letters=dead_letters, timeout=0.1),
+    ]
+    for stage in stages:
+        stage.start()
+    for item in range(7):
+        queues[0].put(item)
+    for stage in stages:
+        stage.close()
+        stage.join()
+    print('finished', list(queues[3].queue))
+    for failure in dead_letters.queue:
+        print('failed', failure.item, repr(failure.error))
+
+    queues = [ClosableQueue(maxsize=10) for _ in range(3)] + [ClosableQueue()]
+    stages = [Stage(slow_download, queues[0], queues[1], workers=4),
+              Stage(slow_upload, queues[1], queues[2]),
+              Stage(resize, queues[2], queues[3])]
+    for stage in stages:
+        stage.start()
+    feeder = Thread(target=lambda: [queues[0].put(item) for item in range(10000)])
+    feeder.start()
+    time.sleep(0.05)
+    start = time.monotonic()
+    discarded, alive = cancel_pipeline(stages, timeout=1)
+    feeder.join()
+    print('cancelled in %.3f seconds: %d queued items discarded, %d threads still alive, %d finished' % (
+        time.monotonic() - start, discarded, len(alive), queues[3].qsize()))
+
+
+"""
+asyncio 단계에서도 같은 일을 해본다. 실패한 아이템은 dead_letters 로 가고, 멈춘 코루틴은 timeout 에 취소된다.
+"""
+
+
+async def flaky_async_resize(item):
+    if item == 3:
+        raise ValueError('corrupt image %d' % item)
+    if item == 5:
+        await asyncio.sleep(10)
+    return item
+
+
+async def run_async_failures(count):
+    in_queue, out_queue, dead_letters = AsyncClosableQueue(), AsyncClosableQueue(), AsyncClosableQueue()
+    stage = AsyncStage(flaky_async_resize, in_queue, out_queue, dead_letters=dead_letters, timeout=0.1)
+    stage.start()
+    for item in range(count):
+        await in_queue.put(item)
+    await stage.close()
+    await stage.join()
+    finished = [out_queue.get_nowait() for _ in range(out_queue.qsize())]
+    failed = [dead_letters.get_nowait().item for _ in range(dead_letters.qsize())]
+
+    in_queue, out_queue = AsyncClosableQueue(maxsize=10), AsyncClosableQueue()
+    stage = AsyncStage(async_download, in_queue, out_queue, concurrency=4)
+    stage.start()
+    for item in range(10):
+        await in_queue.put(item)
+    discarded, alive = await cancel_pipeline_async([stage], timeout=1)
+    return finished, failed, discarded, len(alive)
+
+
+if __name__ == '__main__':
+    finished, failed, discarded, alive = asyncio.run(run_async_failures(10))
+    print('async finished', finished, 'failed', failed)
+    print('async cancel: %d queued items discarded, %d tasks still running' % (discarded, alive))
+
+
+"""
+공유 메모리에 담긴 이미지를 핸들로 넘기기
+
+실제 파이프라인의 아이템은 몇 MB 짜리 이미지 버퍼다. 단계마다 bytes 를 새로 만들면 복사와 메모리 할당이
+아이템마다 일어나고, ProcessStage 로 넘길 때는 pickle 로 직렬화해서 파이프로 보내고 돌려받느라 두 번 더 복사된다.
+
+BufferPool 은 multiprocessing.shared_memory 로 큰 영역(arena) 하나를 만들고 같은 크기의 슬롯으로 나눠 빌려준다.
+큐로는 버퍼 대신 Payload(arena 이름, 오프셋, 길이)만 넘긴다. 튜플 하나라서 pickle 해도 수십 바이트다.
+각 단계는 payload.view() 로 얻은 memoryview 를 제자리에서 읽고 고친다. memoryview 의 슬라이스는 복사하지 않으며,
+다른 프로세스에서는 arena 를 이름으로 한 번 열어두고 계속 쓴다.
+마지막 단계를 releasing 으로 감싸면 처리가 끝난 슬롯을 풀에 돌려준다. 슬롯이 모두 쓰이고 있으면
+acquire 가 기다리므로 풀의 크기가 곧 파이프라인 안에 있을 수 있는 이미지 수의 상한이 된다.
+dead_letters 로 간 Payload 의 슬롯은 그것을 처리하는 쪽에서 release 해야 한다.
+view() 로 얻은 memoryview 는 단계 함수 안에서만 쓰고 붙잡아 두면 안 된다. 남아 있으면 arena 를 닫을 수 없다.
+"""
+
+_arenas = {}
+
+
+def _attach(name):
+    # 다른 프로세스에서는 arena 를 이름으로 열고 열어둔 채로 재사용한다
+    if name not in _arenas:
+        _arenas[name] = SharedMemory(name=name)
+    return _arenas[name]
+
+
+class Payload(namedtuple('Payload', ('name', 'offset', 'length'))):
+    def view(self):
+        return _attach(self.name).buf[self.offset:self.offset + self.length]
+
+
+class BufferPool(object):
+    def __init__(self, slot_size, slots):
+        self.slot_size = slot_size
+        self.memory = SharedMemory(create=True, size=slot_size * slots)
+        _arenas[self.memory.name] = self.memory
+        self.free = Queue()
+        for index in range(slots):
+            self.free.put(index * slot_size)
+
+    def acquire(self, length=None, timeout=None):
+        if length is None:
+            length = self.slot_size
+        if length > self.slot_size:
+            raise ValueError('%d bytes do not fit in a %d byte slot' % (length, self.slot_size))
+        return Payload(self.memory.name, self.free.get(timeout=timeout), length)
+
+    def release(self, payload):
+        # 단계가 슬롯 안의 일부만 가리키도록 오프셋을 옮겼을 수도 있다
+        self.free.put(payload.offset - payload.offset % self.slot_size)
+
+    def close(self):
+        _arenas.pop(self.memory.name, None)
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def releasing(pool, func):
+    def wrapper(payload):
+        try:
+            return func(payload)
+        finally:
+            pool.release(payload)
+    return wrapper
+
+
+"""
+bytes 를 넘기는 파이프라인과 Payload 를 넘기는 파이프라인을 비교한다. resize 는 프로세스에서 실행하고
+이미지를 줄이는 대신 가운데 절반만 잘라낸다. Payload 는 오프셋과 길이만 바꾸면 되므로 복사하지 않는다.
+"""
+
+IMAGE_SIZE = 1 << 20
+
+
+def download_bytes(item):
+    return bytes([item % 256]) * IMAGE_SIZE
+
+
+def resize_bytes(image):
+    quarter = len(image) // 4
+    return image[quarter:-quarter]
+
+
+def upload_bytes(image):
+    return image[0]
+
+
+def download_payload(payload):
+    view = payload.view()
+    view[:] = bytes([payload.offset // IMAGE_SIZE % 256]) * len(view)  # 소켓의 recv_into 를 대신한다
+    return payload
+
+
+def resize_payload(payload):
+    quarter = payload.length // 4
+    return payload._replace(offset=payload.offset + quarter, length=payload.length - 2 * quarter)
+
+
+def upload_payload(payload):
+    return payload.view()[0]
+
+
+def run_image_pipeline(count, download, resize, upload, source):
+    queues = [ClosableQueue() for _ in range(4)]
+    stages = [
+        Stage(download, queues[0], queues[1]),
+        ProcessStage(resize, queues[1], queues[2], workers=2, chunk_size=4),
+        Stage(upload, queues[2], queues[3]),
+    ]
+    for stage in stages:
+        stage.start()
+    start = time.time()
+    for _ in range(count):
+        queues[0].put(source())
+    for stage in stages:
+        stage.close()
+        stage.join()
+    end = time.time()
+    return queues[3].qsize(), end - start
+
+
+if __name__ == '__main__':
+    finished, seconds = run_image_pipeline(200, download_bytes, resize_bytes, upload_bytes,
+                                           iter(range(200)).__next__)
+    print('bytes:   %d images in %.3f seconds' % (finished, seconds))
+    with BufferPool(IMAGE_SIZE, 16) as pool:
+        finished, seconds = run_image_pipeline(200, download_payload, resize_payload,
+                                               releasing(pool, upload_payload), pool.acquire)
+        print('payload: %d images in %.3f seconds, %d slots back in the pool' % (
+            finished, seconds, pool.free.qsize()))
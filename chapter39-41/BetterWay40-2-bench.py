@@ -0,0 +1,281 @@
+"""
+생명 게임 엔진 벤치마크
+
+BetterWay40-2.py 에는 같은 규칙을 계산하는 엔진이 여러 개 있다. 어떤 엔진을 어떤 그리드에 써야 하는지 고르고,
+고친 코드가 느려지지 않았는지 확인하려면 같은 조건에서 재봐야 한다.
+그리드 크기(64^2 ~ 8192^2), 살아 있는 셀의 비율(1% ~ 50%), 세대 수(1 ~ 1000)를 바꿔가며
+초당 셀 수(cells/sec), 최대 메모리 사용량(peak RSS), 세대별 지연시간의 백분위수를 잰다.
+
+최대 메모리 사용량은 프로세스 전체의 값이라서 조건마다 새 파이썬 프로세스를 띄워서 잰다.
+무작위 보드는 셀 하나에 1바이트인 bytes 로 만들고 엔진마다 자기 표현으로 바로 옮긴다. 리눅스에서는 준비가 끝난 뒤
+/proc/self/clear_refs 로 최대 사용량을 지금 값으로 되돌리므로 peak RSS 에는 엔진이 세대를 진행하는 동안의 값만 남는다.
+준비를 마친 시점의 사용량은 setup RSS 로 따로 기록한다. 다른 운영체제에서는 준비 과정도 peak RSS 에 들어간다.
+parallel 엔진의 작업 프로세스는 RUSAGE_CHILDREN 으로 잰다. 작업 프로세스 중 가장 많이 쓴 것의 최대 사용량이다.
+코루틴 엔진으로 8192^2 그리드를 1000세대 돌리면 끝나지 않으므로 엔진마다 계산할 셀 수(넓이 x 세대)의 상한을
+두고, 넘는 조건은 건너뛴 것으로 기록한다. 조건 하나가 --timeout 초(기본 300초)를 넘겨도 건너뛴다.
+
+python BetterWay40-2-bench.py --sizes 64 256 --densities 0.01 0.5 --generations 1 10 --json
+"""
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import time
+
+LIFE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BetterWay40-2.py')
+
+# 엔진별로 한 조건에서 계산할 셀 수(넓이 x 세대)의 상한
+ENGINE_LIMITS = {
+    'coroutine': 2 * 10 ** 6,
+    'batched': 5 * 10 ** 6,
+    'incremental': 5 * 10 ** 6,
+    'bitgrid': 2 * 10 ** 6,
+    'sparse': 10 ** 8,
+    'hashlife': 10 ** 7,  # 살아 있는 셀을 하나씩 트리에 넣는 준비 시간이 넓이에 비례한다
+    'numpy': 10 ** 11,
+    'parallel': 10 ** 11,
+}
+
+
+def load_life():
+    # 파일 이름에 '-' 가 있어서 import 문으로는 불러올 수 없다
+    spec = importlib.util.spec_from_file_location('life', LIFE_PATH)
+    life = importlib.util.module_from_spec(spec)
+    sys.modules['life'] = life
+    spec.loader.exec_module(life)
+    return life
+
+
+def random_board(size, density, seed):
+    # 셀 하나에 1바이트, 1 이면 살아 있다. 밀도는 1/256 단위로 맞춘다
+    rng = random.Random(seed)
+    threshold = int(round(density * 256))
+    table = bytes(1 if value < threshold else 0 for value in range(256))
+    return rng.randbytes(size * size).translate(table)
+
+
+def live_indices(board):
+    index = board.find(1)
+    while index >= 0:
+        yield index
+        index = board.find(1, index + 1)
+
+
+def make_engine(life, name, board, size, logic=None):
+    # (그리드, 한 세대를 진행하는 함수, 정리 함수)를 돌려준다
+    def to_grid():
+        chars = bytes.maketrans(b'\x00\x01', (life.EMPTY + life.ALIVE).encode())
+        grid = life.Grid(size, size)
+        grid.set_rows([list(board[y * size:(y + 1) * size].translate(chars).decode())
+                       for y in range(size)])
+        return grid
+
+    def to_cells(grid):
+        grid.cells[:] = life.np.frombuffer(board, dtype=life.np.uint8).reshape(size, size)
+        return grid
+
+    if name == 'coroutine':
+        sim = life.simulate(size, size, logic)
+        return to_grid(), lambda grid: life.live_a_generation(grid, sim), None
+    if name == 'batched':
+        sim = life.simulate_batched(size, size, by_row=True, logic=logic)
+        return to_grid(), lambda grid: life.live_a_generation(grid, sim), None
+    if name == 'incremental':
+        return to_grid(), lambda grid: life.live_a_generation_incremental(grid, logic), None
+    if name == 'bitgrid':
+        sim = life.simulate(size, size, logic)
+        grid = life.BitGrid(size, size)
+        digits = bytes.maketrans(b'\x00\x01', b'01')
+        for y in range(size):
+            # x 번째 셀이 정수의 x 번째 비트가 되도록 뒤집는다
+            value = int(board[y * size:(y + 1) * size][::-1].translate(digits), 2)
+            grid.bits[y * grid.stride:(y + 1) * grid.stride] = value.to_bytes(grid.stride, 'little')
+        return grid, lambda grid: life.live_a_generation(grid, sim), None
+    if name == 'sparse':
+        grid = life.SparseGrid(size, size)
+        grid.live = {divmod(index, size) for index in live_indices(board)}
+        return grid, lambda grid: life.live_a_generation_sparse(grid, logic), None
+    if name == 'hashlife':
+        grid = life.HashLifeGrid(size, size, logic)
+        for index in live_indices(board):
+            grid.assign(index // size, index % size, life.ALIVE)
+        return grid, life.live_a_generation_hashlife, None
+    if name == 'numpy':
+        step = lambda grid: life.live_a_generation_numpy(grid, logic)
+        return to_cells(life.ArrayGrid(size, size)), step, None
+    if name == 'parallel':
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context('fork'))
+        current = to_cells(life.SharedArrayGrid(size, size))
+        spare = life.SharedArrayGrid(size, size)
+        buffers = [current, spare]
+
+        def step(grid):
+            # 두 공유 메모리 그리드를 번갈아 쓴다
+            other = buffers[0] if grid is buffers[1] else buffers[1]
+            return life.live_a_generation_parallel(grid, pool, other, logic=logic)
+
+        def cleanup():
+            pool.shutdown()
+            for buffer in buffers:
+                buffer.close()
+
+        return current, step, cleanup
+    raise ValueError('Unknown engine: %s' % name)
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def reset_peak_rss():
+    # 리눅스에서만 최대 사용량(VmHWM)을 지금 값으로 되돌릴 수 있다
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def read_status_kib(field):
+    with open('/proc/self/status') as f:
+        return int(re.search(r'^%s:\s+(\d+) kB' % field, f.read(), re.M).group(1))
+
+
+def max_rss_kib(who):
+    # 리눅스에서는 KiB 단위, macOS 에서는 바이트 단위다
+    return resource.getrusage(who).ru_maxrss // (1024 if sys.platform == 'darwin' else 1)
+
+
+def run_case(case):
+    # 새 프로세스 안에서 조건 하나를 잰다
+    life = load_life()
+    size, generations = case['size'], case['generations']
+    board = random_board(size, case['density'], case['seed'])
+    logic = life.Rule(case['rule']) if case.get('rule') else None
+    grid, step, cleanup = make_engine(life, case['engine'], board, size, logic)
+    del board
+    peak_was_reset = reset_peak_rss()
+    setup_rss = read_status_kib('VmRSS') if peak_was_reset else max_rss_kib(resource.RUSAGE_SELF)
+    latencies = []
+    try:
+        for _ in range(generations):
+            start = time.perf_counter()
+            grid = step(grid)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        if cleanup is not None:
+            cleanup()
+    total = sum(latencies)
+    latencies.sort()
+    result = dict(case)
+    result.update({
+        'seconds': total,
+        'cells_per_sec': size * size * generations / total if total else None,
+        'latency_p50': percentile(latencies, 0.5),
+        'latency_p90': percentile(latencies, 0.9),
+        'latency_p99': percentile(latencies, 0.99),
+        'latency_max': latencies[-1],
+        'setup_rss_kib': setup_rss,
+        'peak_rss_kib': (read_status_kib('VmHWM') if peak_was_reset
+                         else max_rss_kib(resource.RUSAGE_SELF)),
+        'includes_setup': not peak_was_reset,
+    })
+    children = max_rss_kib(resource.RUSAGE_CHILDREN)
+    if children:
+        result['children_peak_rss_kib'] = children
+    return result
+
+
+def available_engines():
+    engines = ['coroutine', 'batched', 'incremental', 'bitgrid', 'sparse', 'hashlife']
+    if importlib.util.find_spec('numpy') is not None:
+        engines.append('numpy')
+        if 'fork' in multiprocessing.get_all_start_methods():
+            engines.append('parallel')
+    return engines
+
+
+def benchmark(engines, sizes, densities, generations, seed=0, timeout=None, rule=None):
+    results = []
+    for engine in engines:
+        for size in sizes:
+            for density in densities:
+                for count in generations:
+                    case = {'engine': engine, 'size': size, 'density': density,
+                            'generations': count, 'seed': seed, 'rule': rule}
+                    if size * size * count > ENGINE_LIMITS[engine]:
+                        case['skipped'] = 'over the cell limit of this engine'
+                        results.append(case)
+                        continue
+                    try:
+                        process = subprocess.run(
+                            [sys.executable, __file__, '--case', json.dumps(case)],
+                            capture_output=True, text=True, timeout=timeout)
+                    except subprocess.TimeoutExpired:
+                        case['skipped'] = 'timed out'
+                        results.append(case)
+                        continue
+                    if process.returncode:
+                        # 메모리가 모자라 SIGKILL 로 죽으면 stderr 가 비어 있고 returncode 는 -9 다
+                        lines = process.stderr.strip().splitlines()
+                        case['returncode'] = process.returncode
+                        case['error'] = lines[-1] if lines else 'exited with code %d' % process.returncode
+                        results.append(case)
+                        continue
+                    results.append(json.loads(process.stdout))
+    return results
+
+
+def print_table(results):
+    print('%-11s %6s %7s %6s %14s %10s %10s %10s %10s %10s' % (
+        'engine', 'size', 'density', 'gens', 'cells/sec', 'p50 ms', 'p99 ms', 'setup MiB',
+        'RSS MiB', 'child MiB'))
+    for result in results:
+        prefix = '%-11s %6d %7.2f %6d' % (result['engine'], result['size'],
+                                          result['density'], result['generations'])
+        if 'cells_per_sec' not in result:
+            print(prefix, ' ', result.get('skipped') or result.get('error'))
+            continue
+        print(prefix, '%14.0f %10.3f %10.3f %10.1f %10.1f %10.1f' % (
+            result['cells_per_sec'], result['latency_p50'] * 1000, result['latency_p99'] * 1000,
+            result['setup_rss_kib'] / 1024, result['peak_rss_kib'] / 1024,
+            result.get('children_peak_rss_kib', 0) / 1024))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Game of Life engines')
+    parser.add_argument('--engines', nargs='+', choices=sorted(ENGINE_LIMITS),
+                        default=available_engines())
+    parser.add_argument('--sizes', nargs='+', type=int, default=[64, 512, 2048, 8192])
+    parser.add_argument('--densities', nargs='+', type=float, default=[0.01, 0.1, 0.5])
+    parser.add_argument('--generations', nargs='+', type=int, default=[1, 10, 100, 1000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rule', help='Life-like rule such as B36/S23, game_logic if omitted')
+    parser.add_argument('--timeout', type=float, default=300,
+                        help='seconds before one case is given up')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+    results = benchmark(args.engines, args.sizes, args.densities, args.generations,
+                        args.seed, args.timeout, args.rule)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,11 +6,24 @@
 Query 객체를 넘겨주는 count_neighbors 코루틴으로 수행한다. Query 클래스는 직접 정의하고 클래스의 목적은
 제너레이터 코루틴이 주변 환경에 정보를 요청할 방법을 제공하는 것이다.
 """
-from collections import namedtuple
+import copy
+import os
+import re
+import sys
+import zlib
+from collections import Counter, namedtuple
+from itertools import groupby
+from multiprocessing.shared_memory import SharedMemory
+
+try:
+    import numpy as np
+except ImportError:  # numpy 가 없으면 ArrayGrid 와 그것을 쓰는 엔진만 쓸 수 없다
+    np = None
 
 ALIVE = '*'
 EMPTY = '-'
 Query = namedtuple('Query', ('y', 'x'))
+BatchQuery = namedtuple('BatchQuery', ('coords',))  # 좌표 여러 개를 한 번에 묻는다(아래에서 설명)
 
 """
 코루틴은 각 이웃별로 Query를 넘겨준다.
@@ -58,11 +71,43 @@ def game_logic(state, neighbors):
     return state
 
 
-def step_cell(y, x):
+class Rule(object):
+    # B3/S23 처럼 쓴 규칙. 18칸짜리 룩업 테이블로 바꿔두고 game_logic 대신 쓸 수 있다(아래에서 설명)
+    def __init__(self, notation):
+        match = (re.match(r'^B([0-8]*)/S([0-8]*)$', notation, re.IGNORECASE) or
+                 re.match(r'^S([0-8]*)/B([0-8]*)$', notation, re.IGNORECASE))
+        if not match:
+            raise ValueError('Invalid rule: %r' % notation)
+        born, survive = match.groups()
+        if notation[0] in 'sS':
+            born, survive = survive, born
+        self.born = frozenset(int(n) for n in born)
+        self.survive = frozenset(int(n) for n in survive)
+        # table[state * 9 + neighbors], state 는 0(EMPTY) 또는 1(ALIVE)
+        self.table = (tuple(int(n in self.born) for n in range(9)) +
+                      tuple(int(n in self.survive) for n in range(9)))
+        self.states = tuple(ALIVE if alive else EMPTY for alive in self.table)
+
+    def __call__(self, state, neighbors):
+        return self.states[(state == ALIVE) * 9 + neighbors]
+
+    def __str__(self):
+        return 'B%s/S%s' % (''.join(map(str, sorted(self.born))),
+                            ''.join(map(str, sorted(self.survive))))
+
+    def __repr__(self):
+        return 'Rule(%r)' % str(self)
+
+
+CONWAY = Rule('B3/S23')
+
+
+def step_cell(y, x, logic=None):
+    logic = logic or game_logic  # 규칙을 넘기지 않으면 game_logic 을 쓴다
     state = yield Query(y, x)  # 좌표의 초기 상태를 얻어오는 Query
     # yield from 표현식을 통해 코루틴들을 조합, 재사용하여 간단한 코루틴들로 복잡한 코루틴을 구축할수 있다.
     neighbors = yield from count_neighbors(y, x)  # 주변에 있는 셀들을 조사
-    next_state = game_logic(state, neighbors)  # 셀이 어떤상태가 되어야 하는지 결정
+    next_state = logic(state, neighbors)  # 셀이 어떤상태가 되어야 하는지 결정
     yield Transition(y, x, next_state)  # 셀의 다음 상태를 Transition 객체에 넘겨줌
 
 
@@ -75,11 +120,11 @@ TICK 객체를 넘겨서 현재 세대의 셀을 모두 반환했음을 알린
 TICK = object()
 
 
-def simulate(height, width):
+def simulate(height, width, logic=None):
     while True:
         for y in range(height):
             for x in range(width):
-                yield from step_cell(y, x)
+                yield from step_cell(y, x, logic)
         yield TICK
 
 
@@ -100,6 +145,14 @@ simulate에서 인상적인 부분은 외부 환경과 완전히 분리되어 
 """
 
 
+def zobrist_key(index):
+    # 셀 번호마다 고정된 64비트 난수(splitmix64). 그리드 지문에 쓴다(아래에서 설명)
+    z = (index + 1) * 0x9E3779B97F4A7C15 & 0xFFFFFFFFFFFFFFFF
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+    return z ^ (z >> 31)
+
+
 class Grid(object):
     def __init__(self, height, width):
         self.height = height
@@ -107,6 +160,8 @@ class Grid(object):
         self.rows = []
         for _ in range(self.height):
             self.rows.append([EMPTY] * self.width)
+        self.changed = None  # 지난 세대에서 바뀐 셀의 좌표, None 이면 추적하지 않는다
+        self.fingerprint = 0  # 살아 있는 셀들의 zobrist_key 를 XOR 한 값
 
     def __str__(self):
         output = ''
@@ -120,16 +175,41 @@ class Grid(object):
         return self.rows[y % self.height][x % self.width]
 
     def assign(self, y, x, state):
-        self.rows[y % self.height][x % self.width] = state
+        y %= self.height
+        x %= self.width
+        row = self.rows[y]
+        if row[x] != state:
+            if self.changed is not None:
+                self.changed.add((y, x))
+            self.fingerprint ^= zobrist_key(y * self.width + x)
+            row[x] = state
+
+    def copy(self):
+        clone = Grid(self.height, self.width)
+        clone.rows = [row[:] for row in self.rows]
+        clone.fingerprint = self.fingerprint
+        return clone
+
+    def set_rows(self, rows):
+        # rows 를 통째로 바꿀 때는 assign 을 거치지 않으므로 지문을 처음부터 다시 계산한다
+        self.rows = rows
+        self.fingerprint = 0
+        for y, row in enumerate(rows):
+            for x, cell in enumerate(row):
+                if cell == ALIVE:
+                    self.fingerprint ^= zobrist_key(y * self.width + x)
 
 
 def live_a_generation(grid, sim):
-    progeny = Grid(grid.height, grid.width)
+    progeny = type(grid)(grid.height, grid.width)
     item = next(sim)
     while item is not TICK:
         if isinstance(item, Query):
             state = grid.query(item.y, item.x)
             item = sim.send(state)
+        elif isinstance(item, BatchQuery):
+            states = tuple([grid.query(y, x) for y, x in item.coords])
+            item = sim.send(states)
         else:
             progeny.assign(item.y, item.x, item.state)
             item = next(sim)
@@ -145,40 +225,949 @@ class ColumnPrinter(object):
         self.columns = []
 
     def append(self, data):
-        self.columns.append(data)
+        # 줄 나누기는 출력할 때마다 하지 않고 여기서 한 번만 한다
+        self.columns.append(data.splitlines())
 
     def __str__(self):
-        row_count = 1
-        for data in self.columns:
-            row_count = max(row_count, len(data.splitlines()) + 1)
-        rows = [''] * row_count
-        for j in range(row_count):
-            for i, data in enumerate(self.columns):
-                line = data.splitlines()[max(0, j - 1)]
-                if j == 0:
-                    padding = ' ' * (len(line) // 2)
-                    rows[j] += padding + str(i) + padding
-                else:
-                    rows[j] += line
-                if (i + 1) < len(self.columns):
-                    rows[j] += ' | '
-        return '\n'.join(rows)
-
-
-grid = Grid(5, 5)
-grid.assign(1, 1, ALIVE)
-grid.assign(2, 2, ALIVE)
-grid.assign(2, 3, ALIVE)
-grid.assign(3, 3, ALIVE)
-columns = ColumnPrinter()
-sim = simulate(grid.height, grid.width)
-for i in range(5):
-    columns.append(str(grid))
-    grid = live_a_generation(grid, sim)
-print(columns)
+        return '\n'.join(render_columns(self.columns))
+
+
+def render_columns(columns, start=0):
+    # 세대들을 옆으로 나란히 놓은 줄을 위에서부터 하나씩 만든다. 첫 줄은 세대 번호다
+    row_count = 1
+    for lines in columns:
+        row_count = max(row_count, len(lines) + 1)
+    for j in range(row_count):
+        row = []
+        for i, lines in enumerate(columns):
+            first = lines[0] if lines else ''
+            if j == 0:
+                padding = ' ' * (len(first) // 2)
+                row.append(padding + str(start + i) + padding)
+            elif j - 1 < len(lines):
+                row.append(lines[j - 1])
+            else:
+                row.append(' ' * len(first))
+        yield ' | '.join(row)
+
+
+if __name__ == '__main__':
+    grid = Grid(5, 5)
+    grid.assign(1, 1, ALIVE)
+    grid.assign(2, 2, ALIVE)
+    grid.assign(2, 3, ALIVE)
+    grid.assign(3, 3, ALIVE)
+    columns = ColumnPrinter()
+    sim = simulate(grid.height, grid.width)
+    for i in range(5):
+        columns.append(str(grid))
+        grid = live_a_generation(grid, sim)
+    print(columns)
 
 """
 이 방법의 백미는 주변 코드를 업데이트 하지 않아도 game_logic 함수를 변경할 수 있다는점이다.
 코루틴은 데이터를 동시에 소비하게 하는것이지 변경이 아니여서 기존의 메커니즘이 바뀌여도 코루틴을 바꿀 필요가 없다. 
 이는 코루틴이 어떤 방법으로 관심 영역의 분리를 가능하게 하는지 보여준다.
-"""
\ No newline at end of file
+"""
+
+"""
+NumPy로 한 세대를 통째로 계산하기
+
+코루틴 방식은 셀 하나마다 send 를 아홉 번 주고받고 Query 를 여덟 개 만들기 때문에 큰 그리드에서는 쓸 수가 없다.
+같은 game_logic 규칙을 셀 단위가 아니라 배열 전체에 한 번에 적용하면 이 비용이 사라진다.
+이웃 수는 그리드를 옆으로 굴린(np.roll) 배열들을 더해서 구하고, 끝은 Grid.query 처럼 반대편으로 이어진다.
+game_logic 은 (상태, 이웃 수) 조합 18가지에 대해 한 번씩만 호출해서 룩업 테이블로 만든다.
+그래서 game_logic 을 바꿔도 이 엔진은 고칠 필요가 없다.
+"""
+
+
+def logic_table(logic):
+    # table[state][neighbors] 가 다음 세대에 살아 있으면 1, state 는 0(EMPTY) 또는 1(ALIVE)
+    logic = logic or game_logic
+    if isinstance(logic, Rule):
+        return [list(logic.table[:9]), list(logic.table[9:])]
+    return [[int(logic(state, neighbors) == ALIVE) for neighbors in range(9)]
+            for state in (EMPTY, ALIVE)]
+
+
+class ArrayGrid(object):
+    def __init__(self, height, width):
+        if np is None:
+            raise ImportError('ArrayGrid requires numpy')
+        self.height = height
+        self.width = width
+        self.cells = np.zeros((height, width), dtype=np.uint8)
+
+    @classmethod
+    def from_grid(cls, grid):
+        array_grid = cls(grid.height, grid.width)
+        text = ''.join(str(grid).splitlines()).encode()
+        cells = np.frombuffer(text, dtype=np.uint8) == ord(ALIVE)
+        array_grid.cells = cells.reshape(grid.height, grid.width).astype(np.uint8)
+        return array_grid
+
+    def to_grid(self):
+        grid = Grid(self.height, self.width)
+        grid.set_rows([list(line) for line in str(self).splitlines()])
+        return grid
+
+    def __str__(self):
+        chars = np.where(self.cells, ord(ALIVE), ord(EMPTY)).astype(np.uint8)
+        return ''.join(row.tobytes().decode() + '\n' for row in chars)
+
+    def query(self, y, x):
+        return ALIVE if self.cells[y % self.height, x % self.width] else EMPTY
+
+    def assign(self, y, x, state):
+        self.cells[y % self.height, x % self.width] = state == ALIVE
+
+    @property
+    def fingerprint(self):
+        # zobrist_key 를 uint64 배열로 한꺼번에 계산한다(곱셈은 2^64 에서 자연히 잘린다)
+        z = np.flatnonzero(self.cells).astype(np.uint64) + np.uint64(1)
+        z *= np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z ^= z >> np.uint64(31)
+        return int(np.bitwise_xor.reduce(z)) if z.size else 0
+
+
+def step_rows(rows, table):
+    # rows 는 위아래로 이웃 줄(halo)이 한 줄씩 붙어 있는 배열이다. 가운데 줄들의 다음 상태를 돌려준다.
+    triples = rows + np.roll(rows, 1, axis=1) + np.roll(rows, -1, axis=1)
+    counts = triples[:-2] + triples[1:-1] + triples[2:] - rows[1:-1]
+    return table[rows[1:-1], counts]
+
+
+def live_a_generation_numpy(grid, logic=None):
+    table = np.array(logic_table(logic), dtype=np.uint8)
+    cells = grid.cells
+    padded = np.concatenate((cells[-1:], cells, cells[:1]))
+    progeny = ArrayGrid(grid.height, grid.width)
+    progeny.cells = step_rows(padded, table)
+    return progeny
+
+
+"""
+live_a_generation 과 마찬가지로 새 그리드를 돌려주기 때문에 두 방식의 결과를 세대마다 그대로 비교할 수 있다.
+"""
+if __name__ == '__main__' and np is not None:
+    grid = Grid(5, 5)
+    grid.assign(1, 1, ALIVE)
+    grid.assign(2, 2, ALIVE)
+    grid.assign(2, 3, ALIVE)
+    grid.assign(3, 3, ALIVE)
+    array_grid = ArrayGrid.from_grid(grid)
+    sim = simulate(grid.height, grid.width)
+    for i in range(5):
+        assert str(array_grid) == str(grid)
+        grid = live_a_generation(grid, sim)
+        array_grid = live_a_generation_numpy(array_grid)
+    print('NumPy engine matches the coroutine engine')
+
+
+"""
+살아 있는 셀만 추적하기
+
+Grid 는 모든 셀을 '*'/'-' 문자열로 들고 있고 simulate 는 매 틱마다 모든 좌표를 방문한다.
+그래서 살아 있는 셀이 몇백 개뿐이어도 메모리와 시간이 그리드 넓이에 비례한다.
+SparseGrid 는 살아 있는 셀의 좌표만 집합으로 들고 있다. 다음 세대를 계산할 때는 살아 있는 셀이 이웃에게
+한 표씩 던져서 이웃 수를 세고, 표를 받은 셀과 살아 있던 셀만 game_logic 으로 판단한다.
+비용은 살아 있는 셀 수에 비례한다.
+"""
+NEIGHBORS = ((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1))
+
+
+class SparseGrid(object):
+    def __init__(self, height, width):
+        self.height = height
+        self.width = width
+        self.live = set()
+
+    def __str__(self):
+        rows = [[EMPTY] * self.width for _ in range(self.height)]
+        for y, x in self.live:
+            rows[y][x] = ALIVE
+        return ''.join(''.join(row) + '\n' for row in rows)
+
+    def query(self, y, x):
+        return ALIVE if (y % self.height, x % self.width) in self.live else EMPTY
+
+    def assign(self, y, x, state):
+        cell = (y % self.height, x % self.width)
+        if state == ALIVE:
+            self.live.add(cell)
+        else:
+            self.live.discard(cell)
+
+    @property
+    def fingerprint(self):
+        fingerprint = 0
+        for y, x in self.live:
+            fingerprint ^= zobrist_key(y * self.width + x)
+        return fingerprint
+
+
+def live_a_generation_sparse(grid, logic=None):
+    table = logic_table(logic)
+    if table[0][0]:
+        # 이웃이 하나도 없는 빈 셀이 태어나는 규칙은 그리드 전체를 봐야 한다
+        raise ValueError('Rules that give birth on 0 neighbors are not sparse')
+    height, width = grid.height, grid.width
+    counts = Counter()
+    for y, x in grid.live:
+        for dy, dx in NEIGHBORS:
+            counts[(y + dy) % height, (x + dx) % width] += 1
+    progeny = SparseGrid(height, width)
+    for cell in grid.live | counts.keys():
+        if table[cell in grid.live][counts[cell]]:
+            progeny.live.add(cell)
+    return progeny
+
+
+"""
+HashLife
+
+패턴이 아주 크고 오래 돌려야 한다면 HashLife 를 쓸 수 있다. 평면을 사분 트리(quadtree)로 나누고,
+같은 모양의 노드는 한 번만 만든다(join 을 메모이제이션). 크기가 2^k 인 노드의 가운데 2^(k-1) 영역이
+2^(k-2) 세대 뒤에 어떻게 되는지도 노드마다 한 번만 계산해서 기억한다(successor).
+반복되는 구조가 많은 패턴은 이렇게 기억한 결과를 재사용해서 수많은 세대를 한 번에 건너뛸 수 있다.
+
+HashLife 는 끝이 없는 평면에서 동작한다. 그래서 다른 엔진들처럼 그리드 끝이 반대편으로 이어지지 않고,
+패턴이 그리드 끝에 닿기 전까지만 결과가 같다. height x width 는 평면의 가운데를 보여주는 창문이다.
+가장 작은 4x4 노드의 다음 상태는 game_logic 으로 계산하기 때문에 game_logic 을 바꿔도 그대로 쓸 수 있다.
+"""
+
+
+class _Node(object):
+    __slots__ = ('level', 'nw', 'ne', 'sw', 'se', 'population')
+
+    def __init__(self, level, nw, ne, sw, se, population):
+        self.level = level
+        self.nw = nw
+        self.ne = ne
+        self.sw = sw
+        self.se = se
+        self.population = population
+
+
+class HashLifeGrid(object):
+    def __init__(self, height, width, logic=None):
+        self.height = height
+        self.width = width
+        self.generation = 0
+        # 아래의 캐시는 copy.copy 로 만든 그리드끼리 공유한다
+        self._joins = {}
+        self._successors = {}
+        self._table = logic_table(logic)
+        if self._table[0][0]:
+            raise ValueError('Rules that give birth on 0 neighbors are not sparse')
+        self._off = _Node(0, None, None, None, None, 0)
+        self._on = _Node(0, None, None, None, None, 1)
+        self._zeros = [self._off]
+        self.root = self._zero(3)
+
+    @classmethod
+    def from_grid(cls, grid, logic=None):
+        hashlife = cls(grid.height, grid.width, logic)
+        for y, line in enumerate(str(grid).splitlines()):
+            for x, cell in enumerate(line):
+                if cell == ALIVE:
+                    hashlife.assign(y, x, ALIVE)
+        return hashlife
+
+    def __str__(self):
+        rows = [[EMPTY] * self.width for _ in range(self.height)]
+        for y, x in self.cells():
+            y += self.height // 2
+            x += self.width // 2
+            if 0 <= y < self.height and 0 <= x < self.width:
+                rows[y][x] = ALIVE
+        return ''.join(''.join(row) + '\n' for row in rows)
+
+    def query(self, y, x):
+        y -= self.height // 2
+        x -= self.width // 2
+        node = self.root
+        half = 1 << (node.level - 1)
+        if not (-half <= y < half and -half <= x < half):
+            return EMPTY
+        y += half
+        x += half
+        while node.level > 0:
+            half = 1 << (node.level - 1)
+            if y < half:
+                node = node.nw if x < half else node.ne
+            else:
+                node = node.sw if x < half else node.se
+            y %= half
+            x %= half
+        return ALIVE if node.population else EMPTY
+
+    def assign(self, y, x, state):
+        y -= self.height // 2
+        x -= self.width // 2
+        while not (-(1 << (self.root.level - 1)) <= min(y, x) and
+                   max(y, x) < 1 << (self.root.level - 1)):
+            self.root = self._centre(self.root)
+        half = 1 << (self.root.level - 1)
+        leaf = self._on if state == ALIVE else self._off
+        self.root = self._replace(self.root, y + half, x + half, leaf)
+
+    def cells(self):
+        # 살아 있는 셀의 평면 좌표, 원점은 가운데
+        half = 1 << (self.root.level - 1)
+        stack = [(self.root, -half, -half)]
+        while stack:
+            node, y, x = stack.pop()
+            if not node.population:
+                continue
+            if node.level == 0:
+                yield y, x
+                continue
+            half = 1 << (node.level - 1)
+            stack.append((node.nw, y, x))
+            stack.append((node.ne, y, x + half))
+            stack.append((node.sw, y + half, x))
+            stack.append((node.se, y + half, x + half))
+
+    def step(self, generations):
+        # generations 를 2의 거듭제곱들로 나눠서 한 번에 2^j 세대씩 건너뛴다
+        j = 0
+        while generations >> j:
+            if (generations >> j) & 1:
+                node = self.root
+                while node.level < j + 2:
+                    node = self._centre(node)
+                node = self._centre(self._centre(node))
+                self.root = self._crop(self._successor(node, j))
+            j += 1
+        self.generation += generations
+
+    def _join(self, nw, ne, sw, se):
+        key = (nw, ne, sw, se)
+        node = self._joins.get(key)
+        if node is None:
+            population = nw.population + ne.population + sw.population + se.population
+            node = _Node(nw.level + 1, nw, ne, sw, se, population)
+            self._joins[key] = node
+        return node
+
+    def _zero(self, level):
+        while len(self._zeros) <= level:
+            zero = self._zeros[-1]
+            self._zeros.append(self._join(zero, zero, zero, zero))
+        return self._zeros[level]
+
+    def _centre(self, node):
+        # 같은 가운데를 유지하면서 한 단계 큰 노드로 감싼다
+        zero = self._zero(node.level - 1)
+        return self._join(self._join(zero, zero, zero, node.nw),
+                          self._join(zero, zero, node.ne, zero),
+                          self._join(zero, node.sw, zero, zero),
+                          self._join(node.se, zero, zero, zero))
+
+    def _inner(self, node):
+        return self._join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    def _crop(self, node):
+        while node.level > 3 and self._inner(node).population == node.population:
+            node = self._inner(node)
+        return node
+
+    def _replace(self, node, y, x, leaf):
+        if node.level == 0:
+            return leaf
+        half = 1 << (node.level - 1)
+        quadrants = [node.nw, node.ne, node.sw, node.se]
+        index = (y >= half) * 2 + (x >= half)
+        quadrants[index] = self._replace(quadrants[index], y % half, x % half, leaf)
+        return self._join(*quadrants)
+
+    def _life_4x4(self, node):
+        rows = [
+            [node.nw.nw, node.nw.ne, node.ne.nw, node.ne.ne],
+            [node.nw.sw, node.nw.se, node.ne.sw, node.ne.se],
+            [node.sw.nw, node.sw.ne, node.se.nw, node.se.ne],
+            [node.sw.sw, node.sw.se, node.se.sw, node.se.se],
+        ]
+        bits = [[cell.population for cell in row] for row in rows]
+
+        def next_cell(y, x):
+            count = sum(bits[y + dy][x + dx] for dy, dx in NEIGHBORS)
+            return self._on if self._table[bits[y][x]][count] else self._off
+
+        return self._join(next_cell(1, 1), next_cell(1, 2),
+                          next_cell(2, 1), next_cell(2, 2))
+
+    def _successor(self, node, j):
+        # 크기 2^k 노드의 가운데 2^(k-1) 영역을 2^j 세대(j <= k-2) 진행한 결과
+        key = (node, j)
+        result = self._successors.get(key)
+        if result is not None:
+            return result
+        if not node.population:
+            result = node.nw
+        elif node.level == 2:
+            result = self._life_4x4(node)
+        else:
+            join = self._join
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            quads = [
+                [nw, join(nw.ne, ne.nw, nw.se, ne.sw), ne],
+                [join(nw.sw, nw.se, sw.nw, sw.ne), self._inner(node),
+                 join(ne.sw, ne.se, se.nw, se.ne)],
+                [sw, join(sw.ne, se.nw, sw.se, se.sw), se],
+            ]
+            if j < node.level - 2:
+                # 남은 세대가 절반 이하라면 가운데만 잘라 붙인다
+                c = [[self._successor(quad, j) for quad in row] for row in quads]
+                result = join(join(c[0][0].se, c[0][1].sw, c[1][0].ne, c[1][1].nw),
+                              join(c[0][1].se, c[0][2].sw, c[1][1].ne, c[1][2].nw),
+                              join(c[1][0].se, c[1][1].sw, c[2][0].ne, c[2][1].nw),
+                              join(c[1][1].se, c[1][2].sw, c[2][1].ne, c[2][2].nw))
+            else:
+                c = [[self._successor(quad, j - 1) for quad in row] for row in quads]
+                result = join(self._successor(join(c[0][0], c[0][1], c[1][0], c[1][1]), j - 1),
+                              self._successor(join(c[0][1], c[0][2], c[1][1], c[1][2]), j - 1),
+                              self._successor(join(c[1][0], c[1][1], c[2][0], c[2][1]), j - 1),
+                              self._successor(join(c[1][1], c[1][2], c[2][1], c[2][2]), j - 1))
+        self._successors[key] = result
+        return result
+
+
+def live_a_generation_hashlife(grid, generations=1):
+    progeny = copy.copy(grid)
+    progeny.step(generations)
+    return progeny
+
+
+"""
+두 엔진 모두 새 그리드를 돌려주므로 호출하는 쪽에서 함수만 바꿔 부르면 된다.
+HashLife 는 한 번에 여러 세대를 건너뛸 수도 있다.
+"""
+if __name__ == '__main__':
+    sparse_grid = SparseGrid(5, 5)
+    hashlife_grid = HashLifeGrid(5, 5)
+    for y, x in ((1, 1), (2, 2), (2, 3), (3, 3)):
+        sparse_grid.assign(y, x, ALIVE)
+        hashlife_grid.assign(y, x, ALIVE)
+    for i in range(4):
+        sparse_grid = live_a_generation_sparse(sparse_grid)
+    assert str(live_a_generation_hashlife(hashlife_grid, 4)) == str(sparse_grid)
+    print('Sparse and HashLife engines agree after 4 generations')
+
+
+"""
+여러 코어로 한 세대 나눠서 계산하기
+
+NumPy 엔진도 코어 하나만 쓴다. BetterWay41 에서 gcd 를 ProcessPoolExecutor 로 나눠 계산한 것처럼
+그리드를 가로 띠(band)로 잘라서 띠마다 작업 프로세스에서 계산하게 할 수 있다.
+띠의 첫 줄과 마지막 줄을 계산하려면 바로 위아래 한 줄(halo)이 더 필요하다.
+
+그리드를 리스트나 문자열로 넘기면 세대마다 그리드 전체를 피클링해서 보내야 한다.
+그래서 그리드를 multiprocessing.shared_memory 에 두고 작업 프로세스에는 공유 메모리 이름과 띠의 범위만 넘긴다.
+작업 프로세스는 같은 메모리를 그대로 읽고 자기 띠를 다음 세대 그리드에 직접 쓴다.
+프로세스를 다시 임포트하는 시작 방식(spawn)에서도 동작하도록 예제 코드는 모두 if __name__ == '__main__' 아래에 둔다.
+"""
+
+
+class SharedArrayGrid(ArrayGrid):
+    def __init__(self, height, width):
+        super().__init__(height, width)
+        self.memory = SharedMemory(create=True, size=max(1, height * width))
+        self.cells = np.ndarray((height, width), dtype=np.uint8, buffer=self.memory.buf)
+        self.cells[:] = 0
+
+    @classmethod
+    def from_grid(cls, grid):
+        shared_grid = cls(grid.height, grid.width)
+        shared_grid.cells[:] = ArrayGrid.from_grid(grid).cells
+        return shared_grid
+
+    def close(self):
+        del self.cells
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_attached = {}
+
+
+def _attach(name, height, width):
+    # 작업 프로세스에서 공유 메모리를 이름으로 열고 몇 개까지는 열어둔 채로 재사용한다
+    if name not in _attached:
+        if len(_attached) >= 4:
+            old_name = next(iter(_attached))
+            memory, _ = _attached.pop(old_name)
+            memory.close()
+        memory = SharedMemory(name=name)
+        cells = np.ndarray((height, width), dtype=np.uint8, buffer=memory.buf)
+        _attached[name] = (memory, cells)
+    return _attached[name][1]
+
+
+def step_band(source, target, height, width, start, stop, table):
+    cells = _attach(source, height, width)
+    rows = cells.take(range(start - 1, stop + 1), axis=0, mode='wrap')
+    _attach(target, height, width)[start:stop] = step_rows(rows, np.array(table, dtype=np.uint8))
+
+
+def live_a_generation_parallel(grid, pool, progeny, bands=None, logic=None):
+    # 다음 세대는 progeny 에 쓴다. 세대마다 공유 메모리를 새로 만들면 아무도 닫지 않아서 새어 나가므로
+    # 호출하는 쪽이 SharedArrayGrid 두 개를 만들어 번갈아 넘기고 다 쓰면 닫는다
+    bands = min(bands or os.cpu_count() or 1, grid.height)
+    table = logic_table(logic)
+    bounds = [grid.height * i // bands for i in range(bands + 1)]
+    futures = [pool.submit(step_band, grid.memory.name, progeny.memory.name,
+                           grid.height, grid.width, start, stop, table)
+               for start, stop in zip(bounds, bounds[1:])]
+    for future in futures:
+        future.result()
+    return progeny
+
+
+"""
+세대마다 두 그리드를 번갈아 쓰면 공유 메모리를 새로 만들 필요도 없다.
+"""
+if __name__ == '__main__' and np is not None:
+    from concurrent.futures import ProcessPoolExecutor
+
+    grid = Grid(5, 5)
+    grid.assign(1, 1, ALIVE)
+    grid.assign(2, 2, ALIVE)
+    grid.assign(2, 3, ALIVE)
+    grid.assign(3, 3, ALIVE)
+    array_grid = ArrayGrid.from_grid(grid)
+    with ProcessPoolExecutor(max_workers=2) as pool, \
+            SharedArrayGrid.from_grid(grid) as current, \
+            SharedArrayGrid(grid.height, grid.width) as spare:
+        for i in range(5):
+            assert str(current) == str(array_grid)
+            current, spare = live_a_generation_parallel(current, pool, spare, bands=2), current
+            array_grid = live_a_generation_numpy(array_grid)
+    print('Parallel engine matches the NumPy engine')
+
+
+"""
+바뀐 영역만 다시 계산하기
+
+대부분의 그리드는 세대가 지나도 거의 그대로인데 simulate 는 틱마다 모든 셀의 이웃 여덟 개를 다시 물어본다.
+어떤 셀의 다음 상태는 자기 자신과 이웃 여덟 개로만 정해지므로, 지난 세대에서 그 아홉 칸이 하나도 바뀌지
+않았다면 다음 상태도 지금과 같다. 그래서 Grid.changed 에 바뀐 셀을 기록해두고 다음 세대에는 바뀐 셀과
+그 이웃만 step_cell 로 다시 계산하면 전체를 다시 계산한 것과 결과가 똑같다.
+changed 가 None 인 그리드(직접 만든 그리드)는 어떤 셀이 바뀌었는지 모르므로 첫 세대는 전체를 계산한다.
+"""
+
+
+def live_a_generation_incremental(grid, logic=None):
+    height, width = grid.height, grid.width
+    progeny = grid.copy()
+    progeny.changed = set()
+    if grid.changed is None:
+        cells = [(y, x) for y in range(height) for x in range(width)]
+    else:
+        cells = set()
+        for y, x in grid.changed:
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    cells.add(((y + dy) % height, (x + dx) % width))
+    for y, x in cells:
+        sim = step_cell(y, x, logic)
+        item = next(sim)
+        while isinstance(item, Query):
+            item = sim.send(grid.query(item.y, item.x))
+        progeny.assign(item.y, item.x, item.state)
+    return progeny
+
+
+"""
+글라이더 하나만 움직이는 그리드라면 매 세대 계산하는 셀이 전체 중 몇십 개뿐이다.
+"""
+if __name__ == '__main__':
+    grid = Grid(20, 20)
+    for y, x in ((0, 1), (1, 2), (2, 0), (2, 1), (2, 2)):
+        grid.assign(y, x, ALIVE)
+    incremental_grid = grid
+    sim = simulate(grid.height, grid.width)
+    for i in range(8):
+        grid = live_a_generation(grid, sim)
+        incremental_grid = live_a_generation_incremental(incremental_grid)
+        assert str(incremental_grid) == str(grid)
+    print('Incremental engine matches the coroutine engine,',
+          len(incremental_grid.changed), 'cells changed in the last generation')
+
+
+"""
+Query 를 한꺼번에 보내기
+
+Query 와 Transition 은 이웃 하나마다 sim.send 를 한 번씩 해야 한다. 그래서 live_a_generation 은 셀 하나에
+제너레이터를 아홉 번 다시 시작하는 비용을 낸다. BatchQuery 는 좌표 여러 개를 한 번에 물어보고
+상태들을 튜플로 한 번에 돌려받는다. 코루틴과 주변 환경이 분리되어 있다는 점은 그대로다.
+좌표가 그리드 끝을 넘어가면 어떻게 할지도 여전히 grid.query 가 정한다.
+
+step_cell_batched 는 자기 자신과 이웃 여덟 개를 한 번에 묻고, step_row_batched 는 한 줄을 계산하는 데 필요한
+세 줄을 한 번에 묻는다. 기존의 simulate 는 그대로 두었으므로 하나씩 묻는 방식도 계속 쓸 수 있다.
+"""
+def step_cell_batched(y, x, logic=None):
+    logic = logic or game_logic
+    state, *neighbor_states = yield BatchQuery(
+        ((y, x),) + tuple((y + dy, x + dx) for dy, dx in NEIGHBORS))
+    next_state = logic(state, neighbor_states.count(ALIVE))
+    yield Transition(y, x, next_state)
+
+
+def step_row_batched(y, width, logic=None):
+    logic = logic or game_logic
+    # 양옆 끝의 이웃도 grid.query 로 물어보기 위해 x = -1 부터 width 까지 묻는다
+    xs = range(-1, width + 1)
+    states = yield BatchQuery(tuple((y + dy, x) for dy in (-1, 0, 1) for x in xs))
+    row = states[width + 2:2 * width + 4]
+    columns = [(above == ALIVE) + (middle == ALIVE) + (below == ALIVE)
+               for above, middle, below in zip(states, row, states[2 * width + 4:])]
+    for x in range(width):
+        state = row[x + 1]
+        neighbors = columns[x] + columns[x + 1] + columns[x + 2] - (state == ALIVE)
+        yield Transition(y, x, logic(state, neighbors))
+
+
+def simulate_batched(height, width, by_row=False, logic=None):
+    while True:
+        if by_row:
+            for y in range(height):
+                yield from step_row_batched(y, width, logic)
+        else:
+            for y in range(height):
+                for x in range(width):
+                    yield from step_cell_batched(y, x, logic)
+        yield TICK
+
+
+"""
+live_a_generation 은 BatchQuery 도 처리하므로 simulate 대신 simulate_batched 를 넘기기만 하면 된다.
+"""
+if __name__ == '__main__':
+    grid = Grid(5, 5)
+    grid.assign(1, 1, ALIVE)
+    grid.assign(2, 2, ALIVE)
+    grid.assign(2, 3, ALIVE)
+    grid.assign(3, 3, ALIVE)
+    cell_grid = row_grid = grid
+    sim = simulate(grid.height, grid.width)
+    cell_sim = simulate_batched(grid.height, grid.width)
+    row_sim = simulate_batched(grid.height, grid.width, by_row=True)
+    for i in range(5):
+        grid = live_a_generation(grid, sim)
+        cell_grid = live_a_generation(cell_grid, cell_sim)
+        row_grid = live_a_generation(row_grid, row_sim)
+        assert str(cell_grid) == str(grid) == str(row_grid)
+    print('Batched queries match single queries')
+
+
+"""
+셀 하나를 비트 하나로
+
+Grid.rows 는 셀마다 문자열 참조를 하나씩 들고 있어서 셀 하나에 포인터 8바이트에 리스트 오버헤드까지 든다.
+BitGrid 는 한 줄을 bytearray 의 비트들로 저장해서 셀 하나에 1비트만 쓴다. 1억 셀이면 12.5MB 정도다.
+query/assign 은 Grid 와 같아서 live_a_generation 에 그대로 넘길 수 있다.
+'*'/'-' 텍스트와 주고받을 때는 셀마다 반복하지 않고 한 줄을 정수 하나로 바꿔서 변환한다.
+"""
+_TO_BITS = str.maketrans({ALIVE: '1', EMPTY: '0'})
+_FROM_BITS = str.maketrans({'1': ALIVE, '0': EMPTY})
+
+
+class BitGrid(object):
+    def __init__(self, height, width):
+        self.height = height
+        self.width = width
+        self.stride = (width + 7) // 8  # 한 줄에 쓰는 바이트 수
+        self.bits = bytearray(height * self.stride)
+
+    @classmethod
+    def from_text(cls, text):
+        lines = text.splitlines()
+        grid = cls(len(lines), len(lines[0]) if lines else 0)
+        stride = grid.stride
+        for y, line in enumerate(lines):
+            # x 번째 셀이 정수의 x 번째 비트가 되도록 뒤집는다
+            value = int(line[::-1].translate(_TO_BITS) or '0', 2)
+            grid.bits[y * stride:(y + 1) * stride] = value.to_bytes(stride, 'little')
+        return grid
+
+    @classmethod
+    def from_grid(cls, grid):
+        return cls.from_text(str(grid))
+
+    def __str__(self):
+        stride = self.stride
+        lines = []
+        for y in range(self.height):
+            value = int.from_bytes(self.bits[y * stride:(y + 1) * stride], 'little')
+            line = format(value, '0%db' % (stride * 8))[::-1][:self.width]
+            lines.append(line.translate(_FROM_BITS) + '\n')
+        return ''.join(lines)
+
+    def query(self, y, x):
+        x %= self.width
+        index = (y % self.height) * self.stride + (x >> 3)
+        return ALIVE if self.bits[index] >> (x & 7) & 1 else EMPTY
+
+    def assign(self, y, x, state):
+        x %= self.width
+        index = (y % self.height) * self.stride + (x >> 3)
+        if state == ALIVE:
+            self.bits[index] |= 1 << (x & 7)
+        else:
+            self.bits[index] &= ~(1 << (x & 7))
+
+    @property
+    def fingerprint(self):
+        return hash(bytes(self.bits))
+
+
+"""
+live_a_generation 은 넘겨받은 그리드와 같은 종류의 그리드를 새로 만들기 때문에 BitGrid 도 코루틴으로 진행할 수 있다.
+"""
+if __name__ == '__main__':
+    grid = Grid(5, 5)
+    grid.assign(1, 1, ALIVE)
+    grid.assign(2, 2, ALIVE)
+    grid.assign(2, 3, ALIVE)
+    grid.assign(3, 3, ALIVE)
+    bit_grid = BitGrid.from_grid(grid)
+    sim = simulate(grid.height, grid.width)
+    bit_sim = simulate(grid.height, grid.width)
+    for i in range(5):
+        assert str(bit_grid) == str(grid)
+        grid = live_a_generation(grid, sim)
+        bit_grid = live_a_generation(bit_grid, bit_sim)
+    print('BitGrid matches Grid, a 10000x10000 board takes',
+          len(BitGrid(10000, 10000).bits) // 2 ** 20, 'MiB')
+
+
+"""
+세대를 흘려보내며 출력하기
+
+ColumnPrinter 는 모든 세대를 self.columns 에 들고 있다가 한꺼번에 출력한다. 1000세대를 찍으면
+시뮬레이션보다 출력이 메모리와 시간을 더 많이 쓴다.
+StreamingColumnPrinter 는 window 개의 세대만 들고 있다가 그만큼 모이면 바로 out 에 한 줄씩 쓰고 비운다.
+지난 세대를 다시 보고 싶다면 RleHistory 에 담아둔다. RLE 는 생명 게임 패턴을 저장하는 표준 형식이고
+(b 는 빈 셀, o 는 살아 있는 셀, $ 는 줄바꿈, ! 는 끝, 앞의 숫자는 반복 횟수) zlib 으로 한 번 더 압축한다.
+"""
+
+
+class StreamingColumnPrinter(object):
+    def __init__(self, out=None, window=5):
+        self.out = out if out is not None else sys.stdout
+        self.window = window
+        self.columns = []
+        self.printed = 0  # 이미 출력한 세대 수
+
+    def append(self, data):
+        self.columns.append(data.splitlines())
+        if len(self.columns) >= self.window:
+            self.flush()
+
+    def flush(self):
+        if not self.columns:
+            return
+        if self.printed:
+            self.out.write('\n')
+        for row in render_columns(self.columns, self.printed):
+            self.out.write(row + '\n')
+        self.printed += len(self.columns)
+        self.columns = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+
+def _rle_run(count, tag):
+    return (str(count) if count > 1 else '') + tag
+
+
+def to_rle(text):
+    lines = text.splitlines()
+    width = len(lines[0]) if lines else 0
+    tokens = []
+    cursor = 0  # 지금 쓰고 있는 줄
+    for y, line in enumerate(lines):
+        runs = [(len(list(group)), cell) for cell, group in groupby(line.rstrip(EMPTY))]
+        if not runs:
+            continue
+        if y > cursor:
+            tokens.append(_rle_run(y - cursor, '$'))
+            cursor = y
+        for count, cell in runs:
+            tokens.append(_rle_run(count, 'o' if cell == ALIVE else 'b'))
+    tokens.append('!')
+    body = ['']
+    for token in tokens:
+        if len(body[-1]) + len(token) > 70:
+            body.append('')
+        body[-1] += token
+    return 'x = %d, y = %d\n' % (width, len(lines)) + '\n'.join(body) + '\n'
+
+
+def from_rle(rle):
+    lines = [line for line in rle.splitlines() if line and not line.startswith('#')]
+    header = dict(re.findall(r'(\w+)\s*=\s*([^,\s]+)', lines[0]))
+    width, height = int(header['x']), int(header['y'])
+    rows = [[EMPTY] * width for _ in range(height)]
+    y = x = 0
+    for count, tag in re.findall(r'(\d*)([a-zA-Z$!])', ''.join(lines[1:])):
+        count = int(count or 1)
+        if tag == '!':
+            break
+        elif tag == '$':
+            y += count
+            x = 0
+        else:
+            if tag != 'b':
+                rows[y][x:x + count] = [ALIVE] * count
+            x += count
+    return ''.join(''.join(row) + '\n' for row in rows)
+
+
+class RleHistory(object):
+    def __init__(self, compress=True):
+        self.compress = compress
+        self.generations = []
+
+    def append(self, data):
+        rle = to_rle(data).encode()
+        self.generations.append(zlib.compress(rle) if self.compress else rle)
+
+    def __len__(self):
+        return len(self.generations)
+
+    def __getitem__(self, index):
+        rle = self.generations[index]
+        return from_rle((zlib.decompress(rle) if self.compress else rle).decode())
+
+    def replay(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+"""
+세 세대씩 끊어서 출력하고, 기록해둔 RLE 로 처음부터 다시 재생해본다.
+"""
+if __name__ == '__main__':
+    grid = Grid(5, 5)
+    grid.assign(1, 1, ALIVE)
+    grid.assign(2, 2, ALIVE)
+    grid.assign(2, 3, ALIVE)
+    grid.assign(3, 3, ALIVE)
+    history = RleHistory()
+    sim = simulate(grid.height, grid.width)
+    with StreamingColumnPrinter(window=3) as printer:
+        for i in range(5):
+            printer.append(str(grid))
+            history.append(str(grid))
+            grid = live_a_generation(grid, sim)
+    print(to_rle(history[-1]), end='')
+    replayed = ColumnPrinter()
+    for data in history.replay():
+        replayed.append(data)
+    print(replayed)
+
+
+"""
+같은 세대가 다시 나오면 멈추기
+
+오래 돌린 생명 게임은 대부분 고정된 모양(still life)이나 주기적으로 반복되는 모양(oscillator)에 머물고,
+그 뒤로는 같은 계산을 끝없이 반복한다. 세대마다 그리드 전체를 비교하면 비싸므로 지문(fingerprint)을 쓴다.
+셀마다 고정된 64비트 난수(zobrist_key)를 정해두고 살아 있는 셀의 난수를 모두 XOR 하면 그리드의 지문이 된다.
+셀 하나가 바뀔 때는 그 셀의 난수를 한 번 XOR 하기만 하면 되므로 Grid.assign 에서 항상 최신으로 유지한다.
+CycleDetector 는 지문을 기억해두고 같은 지문이 다시 나오면 반복이 시작된 세대와 주기를 알려준다.
+64비트 지문이 우연히 겹칠 확률은 무시할 만큼 작다.
+Grid.rows 를 assign 없이 통째로 바꿀 때는 set_rows 를 써야 지문이 맞는다(지문이 0 으로 남으면 빈 그리드와 같아 보인다).
+기억하는 지문은 max_history 개까지만 두고 오래된 것부터 버린다. 그래서 주기가 max_history 보다 긴 반복은 찾지 못한다.
+max_history=None 이면 끝까지 모두 기억하므로 메모리가 세대 수만큼 늘어난다.
+
+SparseGrid 와 ArrayGrid 는 살아 있는 셀에서 같은 방식으로 지문을 계산한다.
+BitGrid 는 비트열 전체를 해시한다.
+"""
+
+
+class Cycle(namedtuple('Cycle', ('start', 'period'))):
+    def equivalent(self, generation):
+        # generation 번째 세대와 똑같은, 이미 본 세대의 번호
+        if generation < self.start:
+            return generation
+        return self.start + (generation - self.start) % self.period
+
+
+class CycleDetector(object):
+    def __init__(self, max_history=10000):
+        self.seen = {}  # 지문 -> 처음 본 세대. dict 는 넣은 순서를 지키므로 맨 앞이 가장 오래된 세대다
+        self.generation = 0
+        self.max_history = max_history
+
+    def observe(self, grid):
+        fingerprint = grid.fingerprint
+        start = self.seen.get(fingerprint)
+        if start is None:
+            self.seen[fingerprint] = self.generation
+            if self.max_history is not None and len(self.seen) > self.max_history:
+                del self.seen[next(iter(self.seen))]
+        self.generation += 1
+        if start is not None:
+            return Cycle(start, self.generation - 1 - start)
+        return None
+
+
+"""
+블링커(blinker)는 두 세대마다 같은 모양이 되므로 세 번째 세대에서 주기 2를 찾는다.
+"""
+if __name__ == '__main__':
+    grid = Grid(6, 6)
+    grid.assign(2, 1, ALIVE)
+    grid.assign(2, 2, ALIVE)
+    grid.assign(2, 3, ALIVE)
+    detector = CycleDetector()
+    sim = simulate(grid.height, grid.width)
+    cycle = detector.observe(grid)
+    while cycle is None:
+        grid = live_a_generation(grid, sim)
+        cycle = detector.observe(grid)
+    print('Generation', detector.generation - 1, 'repeats generation', cycle.start,
+          'with period', cycle.period, '- generation 1000 looks like', cycle.equivalent(1000))
+
+
+"""
+규칙을 문자열로 바꾸기
+
+game_logic 은 콘웨이의 규칙(빈 셀은 이웃이 3이면 태어나고, 살아 있는 셀은 이웃이 2나 3이면 산다)을
+if 문으로 적어둔 것이다. 생명 게임과 비슷한 다른 규칙들은 보통 B3/S23 처럼 태어나는(Born) 이웃 수와
+살아남는(Survive) 이웃 수로 적는다. Rule 은 이 표기를 읽어서 (상태 2가지 x 이웃 수 0~8) 18칸 테이블로 바꿔둔다.
+Rule 객체는 game_logic 과 똑같이 호출할 수 있어서 코루틴 엔진에는 그대로 넘기면 되고,
+배열 엔진들은 logic_table 에서 테이블을 바로 꺼내 쓰므로 규칙마다 game_logic 을 18번 호출할 필요도 없다.
+모든 엔진은 logic 인자를 받으며, 넘기지 않으면 지금까지처럼 game_logic 을 쓴다.
+"""
+if __name__ == '__main__':
+    high_life = Rule('B36/S23')
+    grid = Grid(8, 8)
+    for y, x in ((2, 2), (2, 3), (2, 4), (3, 2), (4, 3), (5, 5), (5, 6)):
+        grid.assign(y, x, ALIVE)
+    sparse_grid = SparseGrid(grid.height, grid.width)
+    for y, line in enumerate(str(grid).splitlines()):
+        for x, cell in enumerate(line):
+            sparse_grid.assign(y, x, cell)
+    sim = simulate(grid.height, grid.width, high_life)
+    for i in range(6):
+        grid = live_a_generation(grid, sim)
+        sparse_grid = live_a_generation_sparse(sparse_grid, high_life)
+        assert str(sparse_grid) == str(grid)
+    assert all(CONWAY(state, n) == game_logic(state, n) for state in (ALIVE, EMPTY) for n in range(9))
+    print(repr(high_life), 'runs the same on every engine')
@@ -0,0 +1,164 @@
+"""
+gcd 병렬화 벤치마크
+
+BetterWay41.py 의 main 은 pool.map 한 번을 time.time() 으로 잰 것이 전부다. 한 번만 재면 우연히 빠르거나 느린
+값일 수 있고, 작업자를 몇 개로 늘려야 얼마나 빨라지는지도 알 수 없다.
+이 스크립트는 같은 gcd 작업을 serial(Executor 없이 반복문으로 차례로), thread, process 로 작업자 1 ~ N 개, 여러 입력 크기에서
+trials 번씩 돌려서 다음을 잰다.
+- speedup: serial 평균 시간 / 평균 시간
+- efficiency: speedup / 작업자 수. 1 이면 작업자를 늘린 만큼 빨라진 것이다
+- overhead_per_task: (평균 시간 x 작업자 수 - serial 평균 시간) / 작업 수.
+  작업자들이 실제 계산 말고 주고받고 기다리는 데 쓴 시간을 작업 하나당으로 나눈 값이다
+- stdev: 반복한 시간의 표준편차
+작업자를 띄우는 시간은 빼고 재기 위해 조건마다 풀을 먼저 만들고 작업자를 모두 띄운 다음에 잰다.
+
+--json 으로 결과를 저장해두고 다음에 --baseline 으로 넘기면 같은 조건의 speedup 이 --threshold 비율보다 많이
+떨어진 조건을 알려주고 0 이 아닌 값으로 끝난다.
+
+python BetterWay41-bench.py --workload brute --sizes 4 8 --max-workers 2 --json > baseline.json
+python BetterWay41-bench.py --workload brute --sizes 4 8 --max-workers 2 --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import BetterWay41 as gcd_module
+
+WORKLOADS = {
+    'gcd': gcd_module.gcd,
+    'brute': gcd_module.gcd_brute_force,
+}
+
+DEFAULT_SIZES = {
+    'gcd': [1000, 10000, 100000],
+    'brute': [4, 16, 64],
+}
+
+
+def make_pairs(size, seed):
+    # BetterWay41.numbers 처럼 200만 안팎의 쌍을 만든다
+    rng = random.Random(seed)
+    return [(rng.randrange(1000000, 4000000), rng.randrange(1000000, 4000000)) for _ in range(size)]
+
+
+def time_serial(func, pairs, trials):
+    # 기준이 되는 serial 은 Executor 를 거치지 않고 그냥 반복문으로 잰다
+    seconds = []
+    for _ in range(trials):
+        start = time.perf_counter()
+        for pair in pairs:
+            func(pair)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def time_trials(executor, func, pairs, trials, chunksize):
+    seconds = []
+    for _ in range(trials):
+        start = time.perf_counter()
+        for _ in executor.map(func, pairs, chunksize=chunksize):
+            pass
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def summarize(case, seconds, serial_mean):
+    mean = statistics.mean(seconds)
+    result = dict(case)
+    result.update({
+        'mean': mean,
+        'min': min(seconds),
+        'stdev': statistics.stdev(seconds) if len(seconds) > 1 else 0.0,
+        'speedup': serial_mean / mean,
+        'efficiency': serial_mean / mean / case['workers'],
+        'overhead_per_task': (mean * case['workers'] - serial_mean) / case['size'],
+    })
+    return result
+
+
+def benchmark(workload, backends, sizes, max_workers, trials=5, seed=0, chunksize=1):
+    func = WORKLOADS[workload]
+    inputs = {size: make_pairs(size, seed) for size in sizes}
+    serial = {size: time_serial(func, pairs, trials) for size, pairs in inputs.items()}
+    results = []
+    for size in sizes:
+        case = {'workload': workload, 'backend': 'serial', 'workers': 1, 'size': size}
+        results.append(summarize(case, serial[size], statistics.mean(serial[size])))
+    for backend in backends:
+        if backend == 'serial':
+            continue
+        for workers in range(1, max_workers + 1):
+            with gcd_module.make_executor(backend, workers) as executor:
+                list(executor.map(gcd_module.gcd, [(1, 1)] * workers))  # 작업자를 모두 띄워둔다
+                for size, pairs in inputs.items():
+                    case = {'workload': workload, 'backend': backend, 'workers': workers, 'size': size}
+                    seconds = time_trials(executor, func, pairs, trials, chunksize)
+                    results.append(summarize(case, seconds, statistics.mean(serial[size])))
+    return results
+
+
+def find_regressions(results, baseline, threshold):
+    def key(result):
+        return result['workload'], result['backend'], result['workers'], result['size']
+
+    expected = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = expected.get(key(result))
+        # serial 의 speedup 은 언제나 1 이므로 비교하지 않는다
+        if result['backend'] == 'serial' or old is None:
+            continue
+        if result['speedup'] < old['speedup'] * (1 - threshold):
+            regressions.append((result, old))
+    return regressions
+
+
+def print_table(results):
+    print('%-8s %7s %8s %10s %10s %8s %10s %14s' % (
+        'backend', 'workers', 'size', 'mean ms', 'stdev ms', 'speedup', 'efficiency', 'overhead us'))
+    for result in results:
+        print('%-8s %7d %8d %10.3f %10.3f %8.2f %10.2f %14.1f' % (
+            result['backend'], result['workers'], result['size'], result['mean'] * 1000,
+            result['stdev'] * 1000, result['speedup'], result['efficiency'],
+            result['overhead_per_task'] * 10 ** 6))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure how the gcd workload scales')
+    parser.add_argument('--workload', choices=sorted(WORKLOADS), default='brute')
+    parser.add_argument('--backends', nargs='+', choices=['serial', 'thread', 'process'],
+                        default=['serial', 'thread', 'process'])
+    parser.add_argument('--sizes', nargs='+', type=int, help='number of pairs per run')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--trials', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunksize', type=int, default=1, help='chunksize passed to map')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare speedups with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='fraction of the baseline speedup that may be lost')
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.workload, args.backends, args.sizes or DEFAULT_SIZES[args.workload],
+                        args.max_workers, args.trials, args.seed, args.chunksize)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.threshold)
+        for result, old in regressions:
+            print('regression: %s %d workers %d pairs speedup %.2f < %.2f' % (
+                result['backend'], result['workers'], result['size'], result['speedup'],
+                old['speedup']), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
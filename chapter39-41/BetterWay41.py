@@ -8,11 +8,20 @@
 예를 들어 파이썬으로 여러 CPU 코어를 활용해 계산 집약적인 작업을 한다고 하자.
 두 숫자의 최대 공약수를 찾는 알고리즘을 구현해보자.
 """
+import atexit
+import concurrent.futures
+import math
+import os
+import sys
 import time
-from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from concurrent.futures import (Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait,
+                                FIRST_COMPLETED)
+from itertools import islice
+from threading import Lock
 
 
-def gcd(pair):
+def gcd_brute_force(pair):
     a, b = pair
     low = min(a, b)
     for i in range(low, 0, -1):
@@ -32,15 +41,73 @@ numbers = [(1963309, 2265973), (2030677, 3814172), (15516545, 2229620), (2039045
 이번에는 concurrent.futures 모듈의 ThreadPoolExecutor 클래스와 작업 스레드 두 개를 사용하여 동일한 계산을 수행해보자
 """
 def main():
+    # 부를 때마다 풀을 새로 만들지 않고 아래의 default_pool 을 재사용한다
     start = time.time()
-    pool = ProcessPoolExecutor(max_workers=2)
-    results = list(pool.map(gcd, numbers))
+    results = list(default_pool.map(gcd_brute_force, numbers))
     end = time.time()
     print('Took %.3f seconds' % (end - start))
 
 
+"""
+더 빠른 알고리즘부터
+
+gcd_brute_force 는 min(a, b) 부터 1씩 내려가며 모든 수로 나눠보므로 200만 근처의 쌍 하나에 나머지 연산을 수백만 번 한다.
+병렬로 나누기 전에 알고리즘부터 바꾸자. 유클리드 호제법은 gcd(a, b) = gcd(b, a % b) 를 이용하므로
+나머지 연산을 숫자의 자릿수에 비례하는 만큼만 한다. 위의 쌍들은 한 쌍에 스무 번도 안 된다.
+gcd 는 시그니처가 같으므로 pool.map(gcd, numbers) 처럼 그대로 바꿔 쓸 수 있다.
+
+쌍이 수백만 개라면 파이썬 함수를 쌍마다 부르는 비용이 계산보다 크다. gcd_many 는 쌍의 목록이나 (N, 2) 배열을 받아서
+numpy 가 있으면 np.gcd 로 한 번에 계산하고, 없거나 숫자가 64비트를 넘으면 math.gcd 로 계산한다.
+read_pairs 같은 제너레이터도 받는다. 실수가 섞여 있으면 어느 쪽이든 math.gcd 처럼 TypeError 를 낸다.
+어느 쪽이든 결과는 파이썬 int 의 리스트다. 결과를 numpy 배열 그대로 받고 싶다면 np.gcd 를 직접 쓰면 된다.
+numpy 로는 코어 하나에서 초당 천만 쌍 이상을 계산한다. 파이썬 튜플 리스트를 배열로 바꾸는 시간이 더 걸리므로
+쌍을 처음부터 배열로 만들어두는 것이 좋다.
+"""
+try:
+    import numpy as np
+except ImportError:  # numpy 가 없으면 gcd_many 는 math.gcd 를 쓴다
+    np = None
+
+
+def gcd(pair):
+    a, b = pair
+    a, b = abs(a), abs(b)
+    while b:
+        a, b = b, a % b
+    return a
+
+
+def gcd_many(pairs):
+    if np is not None:
+        if not isinstance(pairs, (list, tuple, np.ndarray)):
+            pairs = list(pairs)  # 제너레이터는 np.asarray 가 받지 못하고 한 번밖에 읽을 수 없다
+        array = np.asarray(pairs)
+        if array.size == 0:
+            return []
+        # 정수 배열만 np.gcd 로 계산한다. 실수는 잘리지 않도록 math.gcd 로 넘겨서 똑같이 TypeError 를 내고,
+        # 64비트를 넘는 정수(object 나 uint64 배열)도 math.gcd 로 계산한다
+        if array.dtype.kind in 'biu' and np.can_cast(array.dtype, np.int64):
+            array = array.reshape(-1, 2)
+            return np.gcd(array[:, 0], array[:, 1]).tolist()
+    return [math.gcd(a, b) for a, b in pairs]
+
+
 if __name__ == '__main__':
-    main()
+    assert list(map(gcd, numbers)) == list(map(gcd_brute_force, numbers))
+    start = time.time()
+    results = list(map(gcd, numbers))
+    end = time.time()
+    print('Euclid took %.6f seconds' % (end - start))
+
+    count = 10 ** 6
+    if np is not None:
+        pairs = np.random.default_rng(0).integers(1, 10 ** 7, size=(count, 2))
+    else:
+        pairs = [(i * 7919 % 10 ** 7 + 1, i * 104729 % 10 ** 7 + 1) for i in range(count)]
+    start = time.time()
+    results = gcd_many(pairs)
+    end = time.time()
+    print('gcd_many: %.1f million pairs per second' % (count / (end - start) / 10 ** 6))
 
 """
 https://docs.python.org/dev/library/concurrent.futures.html#processpoolexecutor-example
@@ -49,4 +116,272 @@ The __main__ module must be importable by worker subprocesses.
 This means that ProcessPoolExecutor will not work in the interactive interpreter.
 
 Calling Executor or Future methods from a callable submitted to a ProcessPoolExecutor will result in deadlock.
-"""
\ No newline at end of file
+"""
+
+
+"""
+작은 작업 수백만 개를 나눠주기
+
+pool.map(gcd, numbers) 는 chunksize 가 1 이라서 작업 하나마다 인자와 결과를 pickle 해서 파이프로 주고받는다.
+gcd 처럼 몇 마이크로초면 끝나는 작업은 계산보다 주고받는 비용이 훨씬 크다. 또 입력을 모두 제출하고
+결과를 list 로 모으므로 입력과 결과가 한꺼번에 메모리에 올라간다.
+
+parallel_map 은 입력을 청크로 묶어서 제출하고 결과를 제너레이터로 하나씩 돌려준다.
+- 청크는 max_in_flight 개까지만 실행 중으로 둔다. 소비자가 결과를 가져가야 다음 청크를 입력에서 꺼내므로
+  파일에서 읽는 쌍처럼 길이를 모르는 입력도 일부만 메모리에 올라간다.
+- chunk_size 를 주지 않으면 작업 프로세스가 청크를 처리하는 데 걸린 시간을 함께 돌려받아서
+  아이템 하나의 비용을 추정하고, 청크 하나가 target_seconds 쯤 걸리도록 다음 청크의 크기를 정한다.
+- ordered=False 면 먼저 끝난 청크의 결과부터 돌려준다. 청크마다 걸리는 시간이 다를 때 앞의 느린 청크를 기다리지 않는다.
+중간에 제너레이터를 닫거나 예외가 나면 아직 시작하지 않은 청크는 취소한다.
+"""
+
+
+def timed_chunk(func, items):
+    start = time.perf_counter()
+    results = [func(item) for item in items]
+    return results, time.perf_counter() - start
+
+
+def parallel_map(func, iterable, pool=None, ordered=True, chunk_size=None, max_in_flight=None,
+                 target_seconds=0.01, max_chunk_size=100000):
+    pool = pool or default_pool
+    items = iter(iterable)
+    max_in_flight = max_in_flight or 2 * (os.cpu_count() or 1)
+    size = chunk_size or 1
+    pending = deque()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < max_in_flight:
+                chunk = list(islice(items, size))
+                if not chunk:
+                    exhausted = True
+                    break
+                pending.append((pool.submit(timed_chunk, func, chunk), len(chunk)))
+            if not pending:
+                return
+            if ordered:
+                finished = [pending.popleft()]
+            else:
+                done, _ = wait([future for future, _ in pending], return_when=FIRST_COMPLETED)
+                finished = [entry for entry in pending if entry[0] in done]
+                for entry in finished:
+                    pending.remove(entry)
+            for future, count in finished:
+                results, seconds = future.result()
+                if chunk_size is None:
+                    per_item = max(seconds / count, 1e-9)
+                    size = max(1, min(max_chunk_size, int(target_seconds / per_item)))
+                yield from results
+    finally:
+        for future, _ in pending:
+            future.cancel()
+
+
+"""
+크기를 모르는 입력으로 파일에 적힌 쌍을 한 줄씩 읽어서 계산한다.
+"""
+
+
+def read_pairs(path):
+    with open(path) as f:
+        for line in f:
+            a, b = line.split()
+            yield int(a), int(b)
+
+
+if __name__ == '__main__':
+    import tempfile
+    count = 50000
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        for i in range(count):
+            f.write('%d %d\n' % (i * 7919 % 10 ** 7 + 1, i * 104729 % 10 ** 7 + 1))
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        start = time.time()
+        expected = list(pool.map(gcd, read_pairs(f.name)))
+        end = time.time()
+        print('pool.map with chunksize=1 took %.3f seconds' % (end - start))
+        for ordered in (True, False):
+            start = time.time()
+            results = list(parallel_map(gcd, read_pairs(f.name), pool, ordered=ordered))
+            end = time.time()
+            print('parallel_map ordered=%s took %.3f seconds, same results: %s' % (
+                ordered, end - start, sorted(results) == sorted(expected)))
+    os.remove(f.name)
+
+
+"""
+한 번 띄운 작업 프로세스를 계속 쓰기
+
+원래의 main 은 부를 때마다 ProcessPoolExecutor(max_workers=2) 를 새로 만들고 닫지 않았다.
+작업 프로세스를 띄우고 모듈을 import 하는 데 수백 밀리초가 걸리므로 작은 배치라면 계산보다 준비가 더 오래 걸리고, 닫지 않은 프로세스는 계속 쌓인다.
+
+WarmPool 은 처음 작업을 제출할 때 ProcessPoolExecutor 를 한 번만 만들고 그 뒤의 배치에서는 계속 재사용한다.
+작업 프로세스 수는 기본으로 os.cpu_count() 이고, 프로그램이 끝날 때 atexit 로 정리한다.
+warm 을 미리 불러두면 첫 배치도 프로세스가 뜨기를 기다리지 않는다.
+작업마다 같이 보내기에는 큰 읽기 전용 데이터는 initializer 로 작업 프로세스마다 한 번만 넘긴다.
+fork 로 띄우는 경우에는 initargs 도 pickle 없이 부모의 메모리를 그대로 물려받는다.
+submit 과 map 이 있으므로 parallel_map 의 pool 로 넘길 수 있고, pool 을 주지 않으면 default_pool 을 쓴다.
+그래서 main 은 default_pool 을 쓰고, default_pool 이 정의된 이 절의 끝에서 부른다.
+"""
+
+
+def _ready(_):
+    return os.getpid()
+
+
+class WarmPool(object):
+    def __init__(self, max_workers=None, initializer=None, initargs=()):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.initializer = initializer
+        self.initargs = initargs
+        self.executor = None
+        self.lock = Lock()
+        atexit.register(self.shutdown)
+
+    def get(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(self.max_workers, initializer=self.initializer,
+                                                    initargs=self.initargs)
+            return self.executor
+
+    def submit(self, func, *args, **kwargs):
+        return self.get().submit(func, *args, **kwargs)
+
+    def map(self, func, *iterables, chunksize=1):
+        return self.get().map(func, *iterables, chunksize=chunksize)
+
+    # 작업 프로세스를 모두 띄워두고 그 pid 들을 돌려준다
+    def warm(self):
+        return set(self.get().map(_ready, range(self.max_workers)))
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+
+default_pool = WarmPool()
+
+
+"""
+작업 프로세스마다 한 번만 받아두는 큰 입력. 작업으로는 쌍의 번호만 보낸다.
+"""
+
+_pairs = None
+
+
+def load_pairs(pairs):
+    global _pairs
+    _pairs = pairs
+
+
+def gcd_at(index):
+    return gcd(_pairs[index])
+
+
+if __name__ == '__main__':
+    batches = [numbers] * 5
+    start = time.time()
+    for batch in batches:
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            list(pool.map(gcd, batch))
+    end = time.time()
+    print('new pool per batch: %.1f ms per batch' % ((end - start) / len(batches) * 1000))
+
+    pool = WarmPool(max_workers=2)
+    pool.warm()
+    start = time.time()
+    for batch in batches:
+        list(pool.map(gcd, batch))
+    end = time.time()
+    print('warm pool: %.1f ms per batch' % ((end - start) / len(batches) * 1000))
+
+    pairs = [(i * 7919 % 10 ** 7 + 1, i * 104729 % 10 ** 7 + 1) for i in range(100000)]
+    shared = WarmPool(max_workers=2, initializer=load_pairs, initargs=(pairs,))
+    results = list(parallel_map(gcd_at, range(len(pairs)), shared))
+    print('gcd of shared pairs by index matches:', results == list(map(gcd, pairs)))
+    main()
+
+
+"""
+실행 방식 고르기
+
+위에서는 ProcessPoolExecutor 를 코드에 박아두었다. 하지만 어떤 방식이 가장 빠른지는 작업에 따라 다르다.
+작업이 아주 작으면 다른 프로세스로 보내는 비용 때문에 그냥 한 스레드에서 차례로 하는 편이 빠르고,
+I/O 를 기다리거나 GIL 을 놓는 작업이면 스레드로 충분하다.
+make_executor 는 이름으로 실행 방식을 고른다. 모두 Executor 라서 submit, map, with 문을 똑같이 쓸 수 있다.
+- serial: 제출한 자리에서 바로 실행한다. 병렬화하지 않았을 때의 기준이다.
+- thread: ThreadPoolExecutor. GIL 이 없는 빌드(free-threaded)라면 CPU 작업도 코어 수만큼 빨라진다.
+- process: ProcessPoolExecutor.
+- interpreter: 서브인터프리터마다 GIL 이 따로 있는 InterpreterPoolExecutor. 파이썬 3.14 부터 있다.
+BetterWay39-5.py 의 ProcessStage 와 BetterWay40-2.py 의 live_a_generation_parallel 도 executor 를 인자로 받으므로
+make_executor 로 만든 것을 그대로 넘기면 된다.
+
+calibrate 는 실제 함수와 입력으로 각 방식을 몇 번씩 돌려보고 가장 빨랐던 방식을 추천한다.
+"""
+
+InterpreterPoolExecutor = getattr(concurrent.futures, 'InterpreterPoolExecutor', None)
+
+# 파이썬 3.13 부터 GIL 없이 빌드할 수 있고, 그런 빌드에서도 GIL 을 다시 켤 수 있다
+FREE_THREADED = hasattr(sys, '_is_gil_enabled') and not sys._is_gil_enabled()
+
+
+class SerialExecutor(Executor):
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as error:
+            future.set_exception(error)
+        return future
+
+
+def available_backends():
+    backends = ['serial', 'thread', 'process']
+    if InterpreterPoolExecutor is not None:
+        backends.append('interpreter')
+    return backends
+
+
+def make_executor(backend, max_workers=None):
+    if backend == 'serial':
+        return SerialExecutor()
+    if backend == 'thread':
+        return ThreadPoolExecutor(max_workers)
+    if backend == 'process':
+        return ProcessPoolExecutor(max_workers)
+    if backend == 'interpreter':
+        if InterpreterPoolExecutor is None:
+            raise ValueError('InterpreterPoolExecutor needs Python 3.14 or later')
+        return InterpreterPoolExecutor(max_workers)
+    raise ValueError('Unknown backend: %s' % backend)
+
+
+def calibrate(func, items, backends=None, max_workers=None, repeat=3):
+    # (추천하는 방식, 방식별로 가장 빨랐던 시간)을 돌려준다
+    items = list(items)
+    timings = {}
+    for backend in backends or available_backends():
+        with make_executor(backend, max_workers) as executor:
+            executor.submit(func, items[0]).result()  # 작업자를 미리 띄워둔다
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for _ in parallel_map(func, items, executor):
+                    pass
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+        timings[backend] = best
+    return min(timings, key=timings.get), timings
+
+
+if __name__ == '__main__':
+    print('backends:', available_backends(), 'free-threaded:', FREE_THREADED)
+    pairs = [(i * 7919 % 10 ** 7 + 1, i * 104729 % 10 ** 7 + 1) for i in range(100000)]
+    for func, items in ((gcd, pairs), (gcd_brute_force, numbers)):
+        backend, timings = calibrate(func, items, repeat=2 if func is gcd else 1)
+        print('%s on %d pairs: use %s (%s)' % (func.__name__, len(items), backend, ', '.join(
+            '%s %.3fs' % (name, seconds) for name, seconds in timings.items())))